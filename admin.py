@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import time
+from checkpoint import snapshot
+
+
+ADMIN_HOST = '127.0.0.1'    # Only local operators can reach the admin channel unless told otherwise
+LIMITS = {'max_connections': int, 'max_per_ip': int, 'rate': float, 'burst': int}
+
+
+
+class AdminError(Exception):
+    ''' An admin command that can't be carried out, sent back to the operator as an error '''
+
+
+
+class AdminChannel:
+    ''' Operator control channel on its own port. Speaks the same '\n' delimited JSON as the player port:
+        {"token": ...} first when a token is set, then {"command": [...]} messages, each answered with {"result": ...} or {"error": ...}.
+        Commands run on the event loop between game steps and read the live tables in place, only building the summaries they send back '''
+    def __init__(self, tables, admission, token=None, watchdog=None):
+        self.tables = {table.table_id: table for table in tables}
+        self.admission = admission
+        self.token = token
+        self.watchdog = watchdog    # watchdog.LoopWatchdog whose lag metrics the 'lag' command reports
+        self.commands = {
+            'help': self.help,
+            'tables': self.list_tables,
+            'connections': self.list_connections,
+            'dump': self.dump,
+            'kick': self.kick,
+            'mute': self.mute,
+            'unmute': self.unmute,
+            'pause': self.pause,
+            'resume': self.resume,
+            'ante': self.set_ante,
+            'limits': self.limits,
+            'lag': self.lag,
+        }
+
+
+    async def handle_client(self, reader, writer):
+        ''' Serves one operator connection '''
+        addr = writer.get_extra_info('peername')
+        logging.info(f"Admin connection from {addr}")
+        try:
+            if self.token is not None:
+                message = json.loads(await reader.readline() or 'null')
+                if not isinstance(message, dict) or not hmac.compare_digest(str(message.get("token", "")), self.token):
+                    logging.warning(f"Admin connection from {addr} failed to authenticate.")
+                    await self.send(writer, {"error": "Invalid token."})
+                    return
+            while True:
+                data = await reader.readline()
+                if not data:
+                    break
+                try:
+                    message = json.loads(data)
+                    logging.info(f"Admin command from {addr}: {message}")
+                    await self.send(writer, {"result": await self.process_command(message["command"])})
+                except (AdminError, ValueError, KeyError, TypeError) as e:
+                    await self.send(writer, {"error": str(e)})
+        except Exception as e:
+            logging.error(f"Error when handling admin connection: {e}")
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def send(self, writer, message):
+        writer.write((json.dumps(message, ensure_ascii=False, default=str) + "\n").encode())
+        await writer.drain()
+
+
+    async def process_command(self, parts):
+        ''' Runs one admin command, such as ['kick', 'adam'], and returns its result '''
+        if not parts or parts[0] not in self.commands:
+            raise AdminError(f"Unknown command, try one of: {', '.join(self.commands)}")
+        return await self.commands[parts[0]](*parts[1:])
+
+    def table(self, table_id=None):
+        ''' A table by id. The id can be left out when there is only one table '''
+        if table_id is None and len(self.tables) == 1:
+            return next(iter(self.tables.values()))
+        for table in self.tables.values():
+            if str(table.table_id) == str(table_id):
+                return table
+        raise AdminError(f"No table {table_id}.")
+
+    def player(self, name):
+        ''' The table a player is sat at, and the player '''
+        for table in self.tables.values():
+            player = table.find_player(name)
+            if player:
+                return table, player
+        raise AdminError(f"No player {name}.")
+
+
+    async def help(self):
+        return list(self.commands)
+
+    async def list_tables(self):
+        return [{
+            "table_id": table.table_id,
+            "players": [player.name for player in table.players],
+            "game_active": table.game_active,
+            "paused": not table.running.is_set(),
+            "street": table.street,
+            "pot": table.pot,
+            "ante": table.ante,
+            "next_ante": table.next_ante,
+        } for table in self.tables.values()]
+
+    async def list_connections(self, table_id=None):
+        tables = [self.table(table_id)] if table_id is not None else self.tables.values()
+        now = time.monotonic()
+        return [{
+            "table_id": table.table_id,
+            "address": connection["address"],
+            "name": connection["name"],
+            "connected_for": round(now - connection["since"], 1),
+        } for table in tables for connection in table.connections.values()]
+
+    async def dump(self, table_id=None):
+        ''' A table's full state, as it would be checkpointed, plus the runtime flags a checkpoint leaves out '''
+        table = self.table(table_id)
+        state = snapshot(table)
+        state["paused"] = not table.running.is_set()
+        state["connected"] = {player.name: player.writer is not None for player in table.players}
+        state["muted"] = [player.name for player in table.players if player.muted]
+        return state
+
+    async def kick(self, name):
+        table, player = self.player(name)
+        await table.kick(player)
+        return f"Kicked {name}."
+
+    async def mute(self, name):
+        _, player = self.player(name)
+        player.muted = True
+        return f"Muted {name}."
+
+    async def unmute(self, name):
+        _, player = self.player(name)
+        player.muted = False
+        return f"Unmuted {name}."
+
+    async def pause(self, table_id=None):
+        await self.table(table_id).pause()
+        return "Paused."
+
+    async def resume(self, table_id=None):
+        await self.table(table_id).resume()
+        return "Resumed."
+
+    async def set_ante(self, amount, table_id=None):
+        ''' Changes the ante, which is also the minimum bet. A hand in progress keeps the ante it was dealt with '''
+        if int(amount) <= 0:
+            raise AdminError("The ante must be positive.")
+        table = self.table(table_id)
+        if table.game_active:
+            table.next_ante = int(amount)
+            await table.broadcast({"broadcast": f"The ante will be ${table.next_ante} from the next hand."})
+            return f"Ante will be {table.next_ante} from the next hand."
+        table.ante = int(amount)
+        await table.broadcast({"broadcast": f"The ante is now ${table.ante}."})
+        return f"Ante is now {table.ante}."
+
+    async def limits(self, *settings):
+        ''' Shows the admission limits, or changes them with settings such as 'rate=2' '''
+        changes = {}
+        for setting in settings:
+            key, _, value = setting.partition('=')
+            if key not in LIMITS:
+                raise AdminError(f"Unknown limit {key}, limits are: {', '.join(LIMITS)}")
+            changes[key] = LIMITS[key](value)
+        self.admission.set_limits(**changes)
+        return {key: getattr(self.admission, key) for key in LIMITS}
+
+
+    async def lag(self):
+        ''' Event loop lag metrics and the most recent stalls '''
+        if self.watchdog is None:
+            raise AdminError("The lag watchdog is off.")
+        return self.watchdog.stats()
+
+
+
+async def start_admin_server(channel, port, host=ADMIN_HOST):
+    return await asyncio.start_server(channel.handle_client, host, port)
+
+
+async def send_command(host, port, command, token=None):
+    ''' Sends one command to a server's admin channel and returns the reply '''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        if token is not None:
+            writer.write((json.dumps({"token": token}) + "\n").encode())
+        writer.write((json.dumps({"command": command}) + "\n").encode())
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCPoker admin channel client")
+    parser.add_argument('-p', '--port', type=int, required=True, help="Admin port of the server (the server's --admin-port).")
+    parser.add_argument('-i', '--host', default=ADMIN_HOST, help='Address of the server.')
+    parser.add_argument('--token', default=None, help="The server's --admin-token, if it was started with one.")
+    parser.add_argument('command', nargs='+', help="Command and arguments, such as 'tables', 'dump', 'kick adam' or 'limits rate=2'.")
+    args = parser.parse_args()
+    reply = asyncio.run(send_command(args.host, args.port, args.command, args.token))
+    print(json.dumps(reply, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import time
+from collections import defaultdict
+
+
+MAX_FRAME_SIZE = 4096       # Largest single message (in bytes, not counting the '\n' delimiter) a client may send
+MAX_CONNECTIONS = 64        # Total open connections the server will accept
+MAX_CONNECTIONS_PER_IP = 4  # Open connections allowed from a single IP address
+COMMAND_RATE = 5.0          # Commands per second a client may send once its burst is used up
+COMMAND_BURST = 10          # Commands a client may send back to back before being rate limited
+
+
+
+class FrameError(Exception):
+    ''' Raised when a client sends a frame that can't be accepted '''
+
+
+
+class TokenBucket:
+    ''' Token bucket rate limiter. Holds up to `capacity` tokens and refills at `rate` tokens per second '''
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.last_refill = clock()
+
+    def available(self, tokens=1):
+        ''' Whether the bucket holds enough tokens, without taking any '''
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+        return self.tokens >= tokens
+
+    def consume(self, tokens=1):
+        ''' Take tokens from the bucket. Returns False (and takes nothing) if there are not enough '''
+        if self.available(tokens):
+            self.tokens -= tokens
+            return True
+        return False
+
+
+
+def check_frame(data, max_frame=MAX_FRAME_SIZE):
+    ''' Cheap sanity checks on a raw frame before it is handed to json.loads.
+        Returns None if the frame looks like a JSON object, otherwise the reason it was rejected '''
+    # Same bound as the StreamReader limit and FrameBuffer, the '\n' doesn't count
+    if len(data) - data.endswith(b'\n') > max_frame:
+        return "Message too large."
+    frame = data.strip()
+    if not frame:
+        return "Empty message."
+    # Every message in the protocol is a single JSON object
+    if frame[:1] != b'{' or frame[-1:] != b'}':
+        return "Invalid message format."
+    return None
+
+
+
+class AdmissionControl:
+    ''' Connection caps and per-IP/per-player command rate limits, shared by every connection to the server '''
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_per_ip=MAX_CONNECTIONS_PER_IP,
+                 rate=COMMAND_RATE, burst=COMMAND_BURST, max_frame=MAX_FRAME_SIZE, clock=time.monotonic):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.rate = rate
+        self.burst = burst
+        self.max_frame = max_frame
+        self.clock = clock
+        self.connections = defaultdict(int)     # Open connections per IP
+        self.ip_buckets = {}
+        self.player_buckets = {}
+        self.throttled = {}     # Commands refused in a row for going over the rate limit, per player (or IP before joining)
+
+    @property
+    def total_connections(self):
+        return sum(self.connections.values())
+
+    def admit(self, ip):
+        ''' Register a new connection from ip. Returns False if it would exceed either connection cap '''
+        if self.total_connections >= self.max_connections or self.connections[ip] >= self.max_per_ip:
+            return False
+        self.connections[ip] += 1
+        return True
+
+    def release(self, ip):
+        ''' Forget a closed connection. The IP's bucket is dropped once it has no connections left '''
+        self.connections[ip] -= 1
+        if self.connections[ip] <= 0:
+            del self.connections[ip]
+            self.ip_buckets.pop(ip, None)
+            self.throttled.pop(ip, None)
+
+    def allow_command(self, ip, name=None):
+        ''' Charge one command against the IP's bucket and, once they have joined, the player's bucket '''
+        # IP buckets are shared by all of an address's connections, so allow each of them a full burst
+        ip_bucket = self.ip_buckets.get(ip)
+        if ip_bucket is None:
+            ip_bucket = self.ip_buckets[ip] = TokenBucket(self.rate * self.max_per_ip, self.burst * self.max_per_ip, self.clock)
+        if name is None:
+            return ip_bucket.consume()
+        player_bucket = self.player_buckets.get(name)
+        if player_bucket is None:
+            player_bucket = self.player_buckets[name] = TokenBucket(self.rate, self.burst, self.clock)
+        # Only charge either bucket once both have a token, or a throttled player would keep draining their IP's budget
+        if not (ip_bucket.available() and player_bucket.available()):
+            return False
+        ip_bucket.consume()
+        player_bucket.consume()
+        return True
+
+    def reject_command(self, ip, name=None):
+        ''' Counts a command refused by allow_command. Returns True for the first one of a throttle window, the only one
+            the client is told about: replying to every refused frame would turn a flood into as much outbound traffic '''
+        key = name or ip
+        self.throttled[key] = self.throttled.get(key, 0) + 1
+        return self.throttled[key] == 1
+
+    def end_throttle(self, ip, name=None):
+        ''' Ends the throttle window once a command is allowed again. Returns how many commands it refused '''
+        return self.throttled.pop(name or ip, 0)
+
+    def forget_player(self, name):
+        self.player_buckets.pop(name, None)
+        self.throttled.pop(name, None)
+
+    def set_limits(self, max_connections=None, max_per_ip=None, rate=None, burst=None):
+        ''' Changes limits while the server is running. Buckets already handed out are updated in place, keeping their tokens '''
+        if max_connections is not None:
+            self.max_connections = max_connections
+        if max_per_ip is not None:
+            self.max_per_ip = max_per_ip
+        if rate is not None:
+            self.rate = rate
+        if burst is not None:
+            self.burst = burst
+        for bucket in self.ip_buckets.values():
+            bucket.rate, bucket.capacity = self.rate * self.max_per_ip, self.burst * self.max_per_ip
+        for bucket in self.player_buckets.values():
+            bucket.rate, bucket.capacity = self.rate, self.burst
@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from deck import CARDS, CARD_IDS
+from evaluator import HAND_RANKINGS
+from equity import hand_class, hand_classes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None   # Only the query side needs numpy, the server writes .npy files without it
+
+
+HANDS_DIR = 'hands'
+CHUNK_SIZE = 5000   # Hands per chunk, each chunk is one directory of column files
+FLUSH_INTERVAL = 30.0   # Seconds buffered hands wait before being written, even if their chunk isn't full
+SEATS = 2
+STREETS = 4
+NO_CARD = 255
+
+# Bits of the 'actions' column, one mask per street and seat
+ACTION_BITS = {'check': 1, 'bet': 2, 'call': 4, 'raise': 8, 'fold': 16}
+VOLUNTARY = ACTION_BITS['bet'] | ACTION_BITS['call'] | ACTION_BITS['raise']    # Money put in the pot by choice, for VPIP
+
+# Column name: (array typecode, .npy dtype, values per hand)
+COLUMNS = {
+    'table_id': ('i', '<i4', 1),
+    'started': ('d', '<f8', 1),     # Unix time the hand started
+    'duration': ('f', '<f4', 1),    # Seconds from the ante to the pot being awarded
+    'street_times': ('f', '<f4', STREETS),  # Seconds into the hand each betting round began, -1 if it wasn't reached
+    'players': ('i', '<i4', SEATS),     # Player ids by seat, see players.json
+    'invested': ('i', '<i4', SEATS),    # Chips each seat put in the pot, ante included
+    'pot': ('i', '<i4', 1),
+    'actions': ('B', '|u1', STREETS * SEATS),   # ACTION_BITS taken, by street then seat
+    'hole_cards': ('B', '|u1', SEATS * 2),  # Card ids by seat
+    'board': ('B', '|u1', 5),   # Card ids, NO_CARD for cards that weren't dealt
+    'showdown': ('B', '|u1', SEATS * 5),    # Best hand each seat showed down, NO_CARD without a showdown
+    'winner': ('b', '|i1', 1),      # Seat that won the pot, -1 for a split pot
+    'category': ('b', '|i1', 1),    # HAND_RANKINGS index of the winning hand, -1 if everyone else folded
+}
+
+
+
+def write_npy(path, dtype, shape, data):
+    ''' Writes raw little-endian data as a version 1.0 .npy file, which numpy.load(path, mmap_mode='r') maps without copying '''
+    header = repr({'descr': dtype, 'fortran_order': False, 'shape': shape}).encode('latin1')
+    # Magic, version and header length take 10 bytes. The header is padded so the data starts on a 64 byte boundary
+    header += b' ' * (-(10 + len(header) + 1) % 64) + b'\n'
+    with open(path, 'wb') as f:
+        f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header)
+        f.write(data)
+
+
+def card_ids(cards, size):
+    ''' Card ids for a list of cards, padded with NO_CARD to size '''
+    return [CARD_IDS[card] for card in cards] + [NO_CARD] * (size - len(cards))
+
+
+
+class HandRecord:
+    ''' One hand being played. The server fills it in as the hand goes, and HandLog.append() stores it once the pot is awarded '''
+    def __init__(self, table_id, seats):
+        self.table_id = table_id
+        self.seats = seats      # Player names by seat
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.street_times = [-1.0] * STREETS
+        self.actions = [0] * (STREETS * SEATS)
+
+    def street(self, street):
+        ''' Marks the start of a betting round '''
+        self.street_times[street] = time.perf_counter() - self.clock
+
+    def action(self, street, seat, action):
+        self.actions[street * SEATS + seat] |= ACTION_BITS[action]
+
+
+
+class HandLog:
+    ''' Columnar log of played hands. Rows are buffered in typed arrays and written out as one .npy file per column,
+        chunk_size hands to a chunk, so a chunk can be memory-mapped and aggregated with numpy without parsing anything.
+        run() writes from a thread: a chunk once it fills, and the chunk being filled every interval seconds, rewriting
+        its files in place so a quiet server doesn't leave a trail of tiny chunks. A crash loses at most interval seconds
+        of hands. Hands resumed from a checkpoint aren't recorded, their earlier streets were lost '''
+    def __init__(self, directory=HANDS_DIR, chunk_size=CHUNK_SIZE, interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self.players_path = os.path.join(directory, 'players.json')
+        self.players = {}   # Player name -> id, saved alongside the chunks
+        if os.path.exists(self.players_path):
+            with open(self.players_path, encoding='utf-8') as f:
+                self.players = {name: i for i, name in enumerate(json.load(f))}
+        # A chunk a previous server left part filled stays as it is, this one starts a new chunk
+        self.chunk = len([name for name in os.listdir(directory) if name.startswith('chunk-')])
+        self.rows = 0
+        self.columns = {name: array(typecode) for name, (typecode, _, _) in COLUMNS.items()}
+        self.taken = 0      # Rows of the open chunk already handed to a write
+        self.ready = []     # Full chunks waiting to be written
+        self.due = asyncio.Event()  # Set when a chunk fills, wakes run() early
+        self.lock = threading.Lock()    # Writes come from run()'s thread and from close()
+        self.saved = {}     # Rows written so far for each chunk, so a late write never replaces a newer one
+        self.saved_players = len(self.players)
+
+    def player_id(self, name):
+        return self.players.setdefault(name, len(self.players))
+
+    def append(self, record, table, winners, category):
+        ''' Adds a finished hand. winners are the players the pot was awarded to '''
+        seats = table.players
+        columns = self.columns
+        columns['table_id'].append(record.table_id)
+        columns['started'].append(record.started)
+        columns['duration'].append(time.perf_counter() - record.clock)
+        columns['street_times'].extend(record.street_times)
+        columns['players'].extend(self.player_id(name) for name in record.seats)
+        columns['invested'].extend(int(player.total_bet) for player in seats)
+        columns['pot'].append(int(table.pot))
+        columns['actions'].extend(record.actions)
+        for player in seats:
+            columns['hole_cards'].extend(card_ids(player.hand, 2))
+            columns['showdown'].extend(card_ids(table.best_hands.get(player, ()), 5))
+        columns['board'].extend(card_ids(table.community_cards, 5))
+        columns['winner'].append(seats.index(winners[0]) if len(winners) == 1 else -1)
+        columns['category'].append(category)
+        self.rows += 1
+        if self.rows >= self.chunk_size:
+            self.ready.append(self.snapshot())
+            self.chunk += 1
+            self.rows = self.taken = 0
+            self.columns = {name: array(typecode) for name, (typecode, _, _) in COLUMNS.items()}
+            self.due.set()
+
+    def snapshot(self):
+        ''' The open chunk as (chunk number, rows, {column: little-endian bytes}), a copy appending can't change '''
+        data = {}
+        for name, column in self.columns.items():
+            if sys.byteorder == 'big':
+                column = array(column.typecode, column)
+                column.byteswap()
+            data[name] = column.tobytes()
+        return self.chunk, self.rows, data
+
+    def pending(self):
+        ''' Takes the full chunks, and the open chunk if it has hands that weren't handed to a write yet '''
+        chunks, self.ready = self.ready, []
+        if self.rows > self.taken:
+            chunks.append(self.snapshot())
+            self.taken = self.rows
+        return chunks
+
+    def save(self, chunks, players):
+        ''' Writes chunks and the player names. Blocking, run() calls it in a thread '''
+        with self.lock:
+            for chunk, rows, data in chunks:
+                if self.saved.get(chunk, 0) >= rows:
+                    continue
+                path = os.path.join(self.directory, f"chunk-{chunk:06d}")
+                if os.path.isdir(path):
+                    # Rewriting the open chunk: each file is replaced whole, so a query maps either the old or the new one
+                    for name, (_, dtype, width) in COLUMNS.items():
+                        shape = (rows,) if width == 1 else (rows, width)
+                        write_npy(os.path.join(path, f"{name}.npy.tmp"), dtype, shape, data[name])
+                        os.replace(os.path.join(path, f"{name}.npy.tmp"), os.path.join(path, f"{name}.npy"))
+                else:
+                    # Written under a temporary name and renamed into place, so queries never see a chunk missing files
+                    partial = os.path.join(self.directory, f"partial-{chunk:06d}")
+                    os.makedirs(partial, exist_ok=True)
+                    for name, (_, dtype, width) in COLUMNS.items():
+                        shape = (rows,) if width == 1 else (rows, width)
+                        write_npy(os.path.join(partial, f"{name}.npy"), dtype, shape, data[name])
+                    os.replace(partial, path)
+                self.saved[chunk] = rows
+            # Names are only ever added, so an older list never overwrites a newer one
+            if len(players) > self.saved_players:
+                with open(self.players_path, 'w', encoding='utf-8') as f:
+                    json.dump(players, f, ensure_ascii=False)
+                self.saved_players = len(players)
+
+    def flush(self):
+        ''' Writes every buffered hand now, blocking '''
+        self.save(self.pending(), list(self.players))
+
+    async def run(self):
+        ''' Writes off the event loop as chunks fill, and the open chunk every interval seconds, until cancelled '''
+        while True:
+            try:
+                await asyncio.wait_for(self.due.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.due.clear()
+            chunks = self.pending()
+            if chunks:
+                try:
+                    await asyncio.to_thread(self.save, chunks, list(self.players))
+                except OSError as e:
+                    logging.error(f"Failed to write hand log: {e}")
+
+    def close(self):
+        self.flush()
+
+
+
+def chunks(directory, columns):
+    ''' Yields each chunk as a dict of memory-mapped numpy arrays, only mapping the columns asked for '''
+    if np is None:
+        raise RuntimeError("Querying hand logs needs numpy, install it with 'pip install numpy'.")
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('chunk-'):
+            chunk = {column: np.load(os.path.join(directory, name, f"{column}.npy"), mmap_mode='r') for column in columns}
+            # The chunk the server is filling is rewritten a file at a time, columns can be a few hands apart meanwhile
+            rows = min(len(values) for values in chunk.values())
+            yield {column: values[:rows] for column, values in chunk.items()}
+
+
+def player_names(directory):
+    with open(os.path.join(directory, 'players.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def class_lookup():
+    ''' 52x52 array from two card ids to the index of their hand class in hand_classes() '''
+    classes = {name: i for i, name in enumerate(hand_classes())}
+    lookup = np.zeros((len(CARDS), len(CARDS)), dtype=np.uint8)
+    for a, first in enumerate(CARDS):
+        for b, second in enumerate(CARDS):
+            if a != b:
+                lookup[a, b] = classes[hand_class([first, second])]
+    return lookup
+
+
+def vpip(directory):
+    ''' Voluntarily put money in pot: the share of hands each player called, bet or raised preflop.
+        Returns {name: (hands, vpip)} '''
+    names = player_names(directory)
+    dealt = np.zeros(len(names))
+    voluntary = np.zeros(len(names))
+    for chunk in chunks(directory, ['players', 'actions']):
+        players = chunk['players'].ravel()
+        preflop = (chunk['actions'][:, :SEATS] & VOLUNTARY) != 0
+        dealt += np.bincount(players, minlength=len(names))
+        voluntary += np.bincount(players, weights=preflop.ravel(), minlength=len(names))
+    return {name: (int(dealt[i]), float(voluntary[i] / dealt[i])) for i, name in enumerate(names) if dealt[i]}
+
+
+def win_rate_by_class(directory):
+    ''' Share of pots won with each starting hand class, split pots count as half. Returns {class: (hands, win rate)} '''
+    classes = hand_classes()
+    lookup = class_lookup()
+    dealt = np.zeros(len(classes))
+    won = np.zeros(len(classes))
+    for chunk in chunks(directory, ['hole_cards', 'winner']):
+        hole = chunk['hole_cards'].reshape(-1, SEATS, 2)
+        hand_classes_dealt = lookup[hole[:, :, 0], hole[:, :, 1]].ravel()
+        winner = chunk['winner'][:, None]
+        share = np.where(winner == -1, 0.5, (winner == np.arange(SEATS)).astype(float)).ravel()
+        dealt += np.bincount(hand_classes_dealt, minlength=len(classes))
+        won += np.bincount(hand_classes_dealt, weights=share, minlength=len(classes))
+    return {name: (int(dealt[i]), float(won[i] / dealt[i])) for i, name in enumerate(classes) if dealt[i]}
+
+
+def pot_distribution(directory, percentiles=(10, 25, 50, 75, 90, 99)):
+    ''' Number of hands, mean pot, pot size at each percentile, and how often each category won the pot '''
+    pots = []
+    categories = np.zeros(len(HAND_RANKINGS) + 1)   # The last slot counts pots won by everyone else folding
+    for chunk in chunks(directory, ['pot', 'category']):
+        pots.append(np.asarray(chunk['pot']))
+        categories += np.bincount(chunk['category'].astype(np.int64) % (len(HAND_RANKINGS) + 1), minlength=len(categories))
+    pots = np.concatenate(pots) if pots else np.zeros(0, dtype=np.int32)
+    return {
+        "hands": len(pots),
+        "mean": float(pots.mean()) if len(pots) else 0.0,
+        "percentiles": dict(zip(percentiles, np.percentile(pots, percentiles).tolist())) if len(pots) else {},
+        "categories": dict(zip(HAND_RANKINGS + ["Uncontested"], categories.astype(int).tolist())),
+    }
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCPoker hand log queries")
+    parser.add_argument('query', choices=['vpip', 'winrate', 'pots'], help='Aggregate to compute.')
+    parser.add_argument('directory', nargs='?', default=HANDS_DIR, help='Hand log written by the server with --hand-log.')
+    parser.add_argument('--min-hands', type=int, default=1, help='Leave out players or hand classes seen in fewer hands.')
+    args = parser.parse_args()
+    if np is None:
+        parser.error("the query tool needs numpy, install it with 'pip install numpy'")
+
+    start = time.perf_counter()
+    if args.query == 'vpip':
+        for name, (hands, share) in sorted(vpip(args.directory).items(), key=lambda item: -item[1][0]):
+            if hands >= args.min_hands:
+                print(f"{name:<20} {hands:>10} hands  VPIP {share:6.1%}")
+    elif args.query == 'winrate':
+        for name, (hands, share) in sorted(win_rate_by_class(args.directory).items(), key=lambda item: -item[1][1]):
+            if hands >= args.min_hands:
+                print(f"{name:<4} {hands:>10} hands  won {share:6.1%}")
+    else:
+        pots = pot_distribution(args.directory)
+        print(f"{pots['hands']} hands, mean pot ${pots['mean']:.2f}")
+        for percentile, pot in pots['percentiles'].items():
+            print(f"  p{percentile:<3} ${pot:.0f}")
+        for category, count in pots['categories'].items():
+            if count:
+                print(f"  {category:<16} {count:>10}")
+    print(f"Query took {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import random
+import time
+import evaluator
+from evaluator import RANKS, SUITS
+from poker import Player
+from workers import process_pool
+
+
+DECISION_BUDGET = 0.05  # Seconds of CPU a bot may spend on one decision
+MAX_ROLLOUTS = 2000     # Rollouts after which a decision stops early, even with budget left
+BOT_WORKERS = 2         # Processes shared by every bot on the server
+BOT_PREFIX = "Bot "     # Bots are named 'Bot 1', 'Bot 2'..., people can't join with a name starting with it
+
+
+
+class BotPlayer(Player):
+    ''' A server-side player whose moves are decided by decide() instead of a connected client '''
+    def __init__(self, name, stack=100):
+        super().__init__(name, None, stack)
+        self.ready = True
+
+
+def is_bot_name(name):
+    return str(name).casefold().startswith(BOT_PREFIX.casefold())
+
+
+def fallback(valid_actions):
+    ''' The move a bot makes when it has no decision in time: check if it can, otherwise fold '''
+    return ('check', 0) if 'check' in valid_actions else ('fold', 0)
+
+
+
+def estimate_equity(hole_cards, community_cards, deadline, rng, max_rollouts=MAX_ROLLOUTS):
+    ''' Monte Carlo equity of hole_cards against one random hand, rolling out boards until the deadline '''
+    known = set(hole_cards) | set(community_cards)
+    deck = [rank + suit for suit in SUITS for rank in RANKS if rank + suit not in known]
+    missing = 5 - len(community_cards)
+    won = 0.0
+    rollouts = 0
+    while rollouts < max_rollouts and (rollouts == 0 or time.perf_counter() < deadline):
+        dealt = rng.sample(deck, missing + 2)
+        board = community_cards + dealt[2:]
+        ours, theirs = evaluator.solve(hole_cards + board)[1], evaluator.solve(dealt[:2] + board)[1]
+        won += 1.0 if ours > theirs else 0.5 if ours == theirs else 0.0
+        rollouts += 1
+    return won / rollouts
+
+
+def decide(hole_cards, community_cards, valid_actions, to_call, pot, current_bet, stack, ante, budget=DECISION_BUDGET, seed=None):
+    ''' Picks a betting action for a bot from its equity and the pot odds. Returns (action, amount).
+        Runs in a worker process and stops rolling out once budget seconds have passed '''
+    deadline = time.perf_counter() + budget
+    equity = estimate_equity(list(hole_cards), list(community_cards), deadline, random.Random(seed))
+    return choose(equity, valid_actions, to_call, pot, current_bet, stack, ante)
+
+
+def choose(equity, valid_actions, to_call, pot, current_bet, stack, ante):
+    ''' The betting action for a hand with the given equity against a random hand. Returns (action, amount) '''
+    if 'check' in valid_actions:
+        bet = max(ante, pot // 2)
+        if equity > 0.65 and 'bet' in valid_actions and bet <= stack:
+            return 'bet', bet
+        return 'check', 0
+    if 'call' in valid_actions:
+        raise_to = current_bet * 2
+        if equity > 0.75 and 'raise' in valid_actions and raise_to <= stack:
+            return 'raise', raise_to
+        if equity >= to_call / (pot + to_call):     # Pot odds
+            return 'call', 0
+    return 'fold', 0
+
+
+
+class BotPool:
+    ''' Runs bot decisions in a bounded process pool shared by every bot on every table.
+        Decisions queue first come first served for a worker, and one that overruns its budget is replaced by a fallback.
+        A worker's slot is only freed once it has actually finished, so overrunning decisions can't pile up in the pool.
+        With an equity.EquityTable, preflop decisions read the hand's equity from the table instead of rolling out '''
+    def __init__(self, max_workers=BOT_WORKERS, budget=DECISION_BUDGET, equity_table=None):
+        self.budget = budget
+        self.equity_table = equity_table
+        self.executor = process_pool(max_workers)
+        self.slots = asyncio.Semaphore(max_workers)     # asyncio.Semaphore wakes waiters in FIFO order
+
+    async def decide(self, hole_cards, community_cards, valid_actions, to_call, pot, current_bet, stack, ante):
+        ''' Returns (action, amount) for a bot, never taking much longer than the budget once a worker is free '''
+        if self.equity_table and not community_cards:
+            try:
+                equity = self.equity_table.equity(hole_cards)
+            except KeyError:
+                pass    # A table built for some classes only, roll this one out
+            else:
+                # One read from the memory-mapped table, cheaper than sending the decision to a worker
+                return choose(equity, valid_actions, to_call, pot, current_bet, stack, ante)
+        await self.slots.acquire()
+        try:
+            future = asyncio.wrap_future(self.executor.submit(decide, hole_cards, community_cards, valid_actions,
+                                                              to_call, pot, current_bet, stack, ante, self.budget))
+        except Exception as e:
+            self.slots.release()
+            logging.warning(f"Bot decision failed, falling back: {e!r}")
+            return fallback(valid_actions)
+        # A worker can't be stopped part way through a decision, the slot stays taken until it's done
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            # Allow for pickling and process scheduling on top of the bot's own budget
+            return await asyncio.wait_for(asyncio.shield(future), self.budget * 2 + 0.1)
+        except Exception as e:
+            logging.warning(f"Bot decision failed or overran its budget, falling back: {e!r}")
+            return fallback(valid_actions)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
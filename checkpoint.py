@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from bots import BotPlayer
+from deck import Deck
+from evaluator import HandState
+from poker import Player
+
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_INTERVAL = 1.0   # Seconds between checkpoints
+RECONNECT_TIMEOUT = 120.0   # Seconds a restored seat is held for its player to reconnect
+
+# Order of the per-player values in a checkpoint, players are stored as lists rather than dicts to keep checkpoints small
+PLAYER_FIELDS = ('name', 'bot', 'stack', 'ready', 'hand', 'ante_placed', 'hand_placed', 'last_action', 'folded', 'total_bet')
+
+
+
+def snapshot(table):
+    ''' Plain data copy of everything needed to carry on a table's hand in another process.
+        Players are referred to by name, since Player objects and their connections don't survive a restart.
+        The table's random number generator isn't saved, so the rest of the hand is drawn from the undealt cards with a fresh one '''
+    name = lambda player: player.name if player else None
+    return {
+        "version": CHECKPOINT_VERSION,
+        "table_id": table.table_id,
+        "game_active": table.game_active,
+        "players": [[p.name, isinstance(p, BotPlayer), p.stack, p.ready, list(p.hand), p.ante_placed,
+                     p.hand_placed, p.last_action, p.folded, p.total_bet] for p in table.players],
+        "deck": table.deck.remaining(),
+        "community_cards": list(table.community_cards),
+        "pot": table.pot,
+        "ante": table.ante,
+        "next_ante": table.next_ante,
+        "dealer_position": table.dealer_position,
+        "street": table.street,
+        "turn": table.turn,
+        "current_player": name(table.current_player),
+        "current_bet": table.current_bet,
+        "pot_committed": {p.name: amount for p, amount in table.pot_committed.items()},
+        "round_complete": table.round_complete,
+        "last_bettor": name(table.last_bettor),
+        "best_hands": {p.name: list(hand) for p, hand in table.best_hands.items()},
+    }
+
+
+def restore(table, state):
+    ''' Loads a snapshot() into a table. Human players come back without a connection (writer is None),
+        holding their seat until they reconnect with the same username '''
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint of table {state.get('table_id')} is not version {CHECKPOINT_VERSION}.")
+    table.players = []
+    for values in state["players"]:
+        fields = dict(zip(PLAYER_FIELDS, values))
+        player = BotPlayer(fields['name'], fields['stack']) if fields['bot'] else Player(fields['name'], None, fields['stack'])
+        player.ready = fields['ready']
+        player.hand = fields['hand']
+        player.ante_placed = fields['ante_placed']
+        player.hand_placed = fields['hand_placed']
+        player.last_action = fields['last_action']
+        player.folded = fields['folded']
+        player.total_bet = fields['total_bet']
+        table.players.append(player)
+
+    seats = {player.name: player for player in table.players}
+    if len(seats) != len(table.players):
+        raise ValueError(f"Checkpoint of table {state['table_id']} has two seats with the same name.")
+    table.table_id = state["table_id"]
+    table.game_active = state["game_active"]
+    table.deck = Deck(table.random, state["deck"])
+    table.community_cards = state["community_cards"]
+    table.pot = state["pot"]
+    table.ante = state["ante"]
+    table.next_ante = state.get("next_ante")
+    table.dealer_position = state["dealer_position"]
+    table.street = state["street"]
+    table.turn = state["turn"]
+    table.current_player = seats.get(state["current_player"])
+    table.current_bet = state["current_bet"]
+    table.pot_committed = {seats[name]: amount for name, amount in state["pot_committed"].items()}
+    table.round_complete = state["round_complete"]
+    table.last_bettor = seats.get(state["last_bettor"])
+    table.best_hands = {seats[name]: hand for name, hand in state["best_hands"].items()}
+    # Hand states are derived from the cards, so they are rebuilt rather than stored
+    for player in table.players:
+        if player.hand:
+            player.hand_state = HandState(player.hand + table.community_cards)
+    return table
+
+
+def table_path(directory, table_id):
+    return os.path.join(directory, f"table-{table_id}.json")
+
+
+def load(directory):
+    ''' Every table snapshot in a checkpoint directory, or an empty list if there isn't one '''
+    if not os.path.isdir(directory):
+        return []
+    states = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith('table-') and filename.endswith('.json'):
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                states.append(json.load(f))
+    return states
+
+
+
+class Checkpointer:
+    ''' Periodically checkpoints tables to a directory, one file per table.
+        Snapshots are taken on the event loop, only between turns, and only tables whose snapshot differs from the last one
+        written are saved, so idle tables cost a snapshot and a comparison. Encoding and writing happen in a thread.
+        Each file is written to a temporary file, flushed to disk and then renamed over the old one, so a crash or power
+        loss leaves either the previous checkpoint or the new one '''
+    def __init__(self, directory, tables, interval=CHECKPOINT_INTERVAL):
+        self.directory = directory
+        self.tables = tables
+        self.interval = interval
+        self.written = {}   # Last snapshot written for each table id
+        self.lock = threading.Lock()    # One save at a time, the final write on shutdown can overlap a periodic one
+        os.makedirs(directory, exist_ok=True)
+
+    def changed(self):
+        ''' Snapshots of the tables that changed since the last write. A table part way through a step (a betting action
+            applied but the turn not moved on yet, or the pot paid out but the hand not reset yet) is left for the next
+            checkpoint, restoring it would replay the action or pay the pot twice '''
+        states = []
+        for table in self.tables:
+            if table.acted:
+                continue
+            state = snapshot(table)
+            if self.written.get(table.table_id) != state:
+                states.append(state)
+        return states
+
+    def save(self, states):
+        ''' Writes snapshots to disk. Returns how many files were written '''
+        with self.lock:
+            for state in states:
+                path = table_path(self.directory, state["table_id"])
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(state, f, separators=(',', ':'), ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(path + '.tmp', path)
+                self.written[state["table_id"]] = state
+            if states and os.name == 'posix':
+                # The renames only survive a power loss once the directory itself is on disk
+                fd = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        return len(states)
+
+    def write(self):
+        ''' Checkpoints the tables that changed since the last write, blocking until they are on disk. Returns how many
+            files were written '''
+        return self.save(self.changed())
+
+    async def run(self):
+        ''' Writes a checkpoint every interval seconds until cancelled '''
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.save, self.changed())
+            except OSError as e:
+                logging.error(f"Failed to write checkpoint: {e}")
@@ -1,40 +1,57 @@
 import asyncio
-import json
 import logging
 import argparse
 import sys
+from functools import lru_cache
 from prompt_toolkit import PromptSession
 from prompt_toolkit.patch_stdout import patch_stdout
+from transport import use_uvloop
+from headless import HeadlessClient
 
 
-logging.basicConfig(
-    # Configure logging
-    filename='client.log',
-    level=logging.INFO, 
-    format='%(asctime)s - %(levelname)s - %(message)s'
-    )
 
+FRAME_INTERVAL = 0.05   # Seconds between screen updates, messages arriving within one frame are drawn together
 
-class TCPokerClient:
-    ''' Manages client state '''
-    def __init__(self, host, port, username):
-        self.host = host
-        self.port = port
-        self.username = username
-        self.reader = None
-        self.writer = None
+# Rows of the ASCII art for a card
+CARD_TEMPLATE = [
+    ' ___ ',
+    '|{} |',
+    '| {} |',
+    '|_{}|'
+]
+
+
+@lru_cache(maxsize=None)
+def card_art(card):
+    ''' Rows of ASCII art for one card, each card is only ever drawn once '''
+    rank = card[0]
+    suit = card[1]
+    # pad single digit ranks 
+    rank_top = f'{rank} '
+    rank_bot = f'_{rank}' 
+    return (CARD_TEMPLATE[0], CARD_TEMPLATE[1].format(rank_top), CARD_TEMPLATE[2].format(suit), CARD_TEMPLATE[3].format(rank_bot))
+
+
+def render_cards(cards):
+    ''' Creates ASCII art for cards, laid out side by side, as a single string '''
+    rows = zip(*(card_art(card) for card in cards))
+    return "\n".join(" ".join(row) + " " for row in rows)
+
+
+class TCPokerClient(HeadlessClient):
+    ''' Terminal UI for TCPoker. Protocol handling and client state are managed by HeadlessClient '''
+    def __init__(self, host, port, username, transport='streams'):
+        super().__init__(host, port, username, transport)
         self.session = PromptSession()
-        self.valid_commands = ['ready', 'status', 'exit']
-        self.game_started = False
         self.refresh_prompt_event = asyncio.Event() 
+        self.pending_output = []    # Lines waiting for the next frame
+        self.flush_handle = None
         
         
     async def connect(self):
         ''' First thing a client does is connect to the server and send their custom username '''
         try:
-            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
-            logging.info(f"Connected to server at {self.host}:{self.port}")
-            await self.send_message({"username": self.username})
+            await super().connect()
             
             self.refresh_prompt_event.set()
             
@@ -46,85 +63,72 @@ class TCPokerClient:
             logging.error(f"Connection failed: {e}")
 
 
-    async def send_message(self, message):
-        ''' Sends a message to server using clients StreamWriter '''
-        try:
-            self.writer.write((json.dumps(message) + "\n").encode())        # All messages end with '\n' delimiter
-            await self.writer.drain()
-            logging.info(f"{self.username} Sent: {message}")
-        except Exception as e:
-            logging.error(f"Failed to send message: {e}")
-
-
     async def receive_messages(self):
         ''' Asyncio task, received messages print above clients input_loop() '''
-        try:
-            while True:
-                data = await self.reader.readline()
-                if not data:
-                    # If the server exits
-                    logging.info("Server closed the connection.")
-                    print("Disconnected from server.")
-                    await asyncio.sleep(1)
-                    sys.exit(1)
-                    break
-                message = json.loads(data.decode())
-                logging.info(f"{self.username} received message: {message}")
-                await self.handle_message(message)      # Handle received messages
-        except Exception as e:
-            logging.error(f"Error receiving message: {e}")
+        await super().receive_messages()
+        # If the server exits
+        print("Disconnected from server.")
+        await asyncio.sleep(1)
+        sys.exit(1)
 
 
     async def handle_message(self, message):
-        ''' Handles any received messages '''
+        ''' Renders any received messages, after HeadlessClient has applied them to the client state.
+            Output is queued and written once per frame by flush_output() '''
+        out = self.pending_output
         if "broadcast" in message:
-            print(f"\n{message['broadcast']}")
+            out.append(f"\n{message['broadcast']}")
 
         elif "status" in message:
             status = message['status']
-            print("\nPlayer Status:")
+            out.append("\nPlayer Status:")
             for name, ready in status.items():
-                print(f"{name}: {'Ready' if ready else 'Not Ready'}")
+                out.append(f"{name}: {'Ready' if ready else 'Not Ready'}")
 
         elif "hand" in message:
-            print(f"\nYour hand: ")
-            await self.print_cards(message['hand'])
+            out.append(f"\nYour hand: ")
+            out.append(render_cards(message['hand']))
+            if "current_hand" in message:
+                current_hand = message['current_hand']
+                out.append(f"Current hand: {current_hand['name']}" + (f" ({current_hand['outs']} outs)" if current_hand['outs'] else ""))
+                if "equity" in current_hand:
+                    out.append(f"Preflop equity against a random hand: {current_hand['equity']:.1%}")
 
         elif "stack" in message:
-            print(f"\n You have: ${message['stack']}")
+            out.append(f"\n You have: ${message['stack']}")
 
         elif "error" in message:
-            print(f"\nError: {message['error']}")
-
-        elif "start_game" in message:
-            self.game_started = True
+            out.append(f"\nError: {message['error']}")
 
         elif "action" in message:
             if message["action"] == "collect_ante":
-                print(f"\nYou must bet atleast the ante ({message['amount']}) to participate in this hand.")
-                self.valid_commands = ['ante']
+                out.append(f"\nYou must bet atleast the ante ({message['amount']}) to participate in this hand.")
 
             elif message["action"] == "collect_bets":
-                print(f"\nIt's your turn!\nThe pot is ${message['pot']}\nThe current bet is ${message['current_bet']}")
-                self.valid_commands = message["valid_actions"]
+                out.append(f"\nIt's your turn!\nThe pot is ${message['pot']}\nThe current bet is ${message['current_bet']}")
 
             elif message["action"] == "collect_hands":
-                print(f"\nTime to send your best 5-card Poker hand!\nChoose 5 cards from your hand (h1, h2) and the community cards (c1, c2, c3, c4, c5)\nExample command format: hand c1 c2 c3 h1 h2")
-                self.valid_commands = ['hand']
-
-            elif message["action"] == "clear_prompt":
-                self.valid_commands = []
+                out.append(f"\nTime to send your best 5-card Poker hand!\nChoose 5 cards from your hand (h1, h2) and the community cards (c1, c2, c3, c4, c5)\nExample command format: hand c1 c2 c3 h1 h2")
 
         elif "game_state" in message:
             if message["game_state"] == "lobby":
-                print("\nReturning to lobby...")
-                self.game_started = False
-                self.valid_commands = ['ready', 'status', 'exit']
+                out.append("\nReturning to lobby...")
         
         elif "community_cards" in message:
-            print(f"\nCommunity cards: ")
-            await self.print_cards(message['community_cards'])
-                
+            out.append(f"\nCommunity cards: ")
+            out.append(render_cards(message['community_cards']))
+
+        # Bursts of messages (a new street sends community cards, hand, stack and broadcasts) share one redraw
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(FRAME_INTERVAL, self.flush_output)
+
+
+    def flush_output(self):
+        ''' Writes everything queued since the last frame in a single write, then refreshes the prompt once '''
+        self.flush_handle = None
+        if self.pending_output:
+            print("\n".join(self.pending_output))
+            self.pending_output = []
         # Update and refresh the prompt message
         self.session.message = f"Enter a command {self.valid_commands}: "
         self.session.app.invalidate()   
@@ -182,48 +186,27 @@ class TCPokerClient:
                 await self.prompt_user()
 
 
-    async def print_cards(self, cards):
-        ''' Creates ASCII art for cards '''
-        card_template = [
-            ' ___ ',
-            '|{} |',
-            '| {} |',
-            '|_{}|'
-        ]
-
-        formatted_cards = []
-        for card in cards:
-            rank = card[0]
-            suit = card[1]
-            # pad single digit ranks 
-            rank_top = f'{rank} '
-            rank_bot = f'_{rank}' 
-            formatted_cards.append((rank_top, suit, rank_bot))
-
-        # Print each row for all cards
-        for row_idx in range(len(card_template)):
-            for card in formatted_cards:
-                if row_idx == 0:
-                    print(card_template[row_idx], end=' ')
-                elif row_idx == 1:
-                    print(card_template[row_idx].format(card[0]), end=' ')
-                elif row_idx == 2:
-                    print(card_template[row_idx].format(card[1]), end=' ')
-                else:
-                    print(card_template[row_idx].format(card[2]), end=' ') 
-            print()
-
-
 
 if __name__ == "__main__":
-    username = input("Enter your username: ")
+    logging.basicConfig(
+        # Configure logging
+        filename='client.log',
+        level=logging.INFO, 
+        format='%(asctime)s - %(levelname)s - %(message)s'
+        )
     parser = argparse.ArgumentParser(description="TCP Poker Client")
     parser.add_argument('-i', '--ip', type=str, required=True, help='Server IP Address.')
     parser.add_argument('-p', '--port', type=int, required=True, help='Server Port.')
+    parser.add_argument('-u', '--username', type=str, default=None, help='Username, asked for if not given.')
+    parser.add_argument('-t', '--transport', choices=['streams', 'protocol'], default='streams', help='Connection handling, asyncio streams or the lower overhead FrameProtocol.')
+    parser.add_argument('--uvloop', action='store_true', help='Use the uvloop event loop if it is installed.')
 
     args = parser.parse_args()
+    if args.uvloop:
+        use_uvloop()
+    username = args.username or input("Enter your username: ")
 
-    client = TCPokerClient(args.ip, args.port, username)
+    client = TCPokerClient(args.ip, args.port, username, args.transport)
     try:
         asyncio.run(client.connect())
     except KeyboardInterrupt:
@@ -0,0 +1,71 @@
+from evaluator import RANKS, SUITS
+
+
+# Every card, built once. A card's index here is its id in bulk deals and the hand log
+CARDS = tuple(f"{rank}{suit}" for suit in SUITS for rank in RANKS)
+CARD_IDS = {card: i for i, card in enumerate(CARDS)}
+BULK_CHUNK = 65536      # Deals shuffled at a time by deal_batch(), bounds its scratch memory
+
+
+
+class Deck:
+    ''' A preallocated deck dealt with a lazy partial Fisher-Yates shuffle. Each draw swaps a random undealt card into
+        the next position, so a hand only pays for the cards it uses instead of shuffling all 52 up front.
+        reset() returns the cards without reallocating anything, and draws are reproducible for a seeded random.Random '''
+    __slots__ = ('cards', 'dealt', 'random')
+
+    def __init__(self, rng, remaining=None):
+        ''' remaining restores a deck part way through a hand, only those cards are left to deal until reset() '''
+        if remaining is None:
+            self.cards = list(CARDS)
+            self.dealt = 0
+        else:
+            left = set(remaining)
+            self.cards = [card for card in CARDS if card not in left] + list(remaining)
+            self.dealt = len(CARDS) - len(remaining)
+        self.random = rng
+
+    def reset(self):
+        ''' Puts every card back in the deck. Cards aren't reordered, draws pick uniformly from whatever order they are in '''
+        self.dealt = 0
+
+    def draw(self):
+        cards, i = self.cards, self.dealt
+        j = self.random.randrange(i, len(cards))
+        cards[i], cards[j] = cards[j], cards[i]
+        self.dealt = i + 1
+        return cards[i]
+
+    def draw_many(self, count):
+        return [self.draw() for _ in range(count)]
+
+    def remaining(self):
+        ''' The cards that haven't been dealt, in no particular order '''
+        return self.cards[self.dealt:]
+
+    def __len__(self):
+        return len(self.cards) - self.dealt
+
+
+
+def deal_batch(count, cards=9, seed=None):
+    ''' Bulk deals for simulators: a (count, cards) uint8 array of card ids (indexes into CARDS), each row the first cards of
+        an independently shuffled deck. Vectorised partial Fisher-Yates across rows, the same seed gives the same deals '''
+    # Imported here rather than at the top, so the core module (and every worker importing it) doesn't load numpy
+    try:
+        import numpy as np
+    except ImportError:
+        raise RuntimeError("Bulk dealing needs numpy, install it with 'pip install numpy'.") from None
+    rng = np.random.default_rng(seed)
+    deals = np.empty((count, cards), dtype=np.uint8)
+    for start in range(0, count, BULK_CHUNK):
+        n = min(BULK_CHUNK, count - start)
+        decks = np.tile(np.arange(len(CARDS), dtype=np.uint8), (n, 1))
+        rows = np.arange(n)
+        for i in range(cards):
+            j = rng.integers(i, len(CARDS), n)
+            picked = decks[rows, j]
+            decks[rows, j] = decks[:, i]
+            decks[:, i] = picked
+        deals[start:start + n] = decks[:, :cards]
+    return deals
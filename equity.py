@@ -0,0 +1,163 @@
+import argparse
+import mmap
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from evaluator import CARD_RANKS, RANKS, SUITS, solve
+
+
+EQUITY_FILE = 'preflop_equity.bin'
+MAGIC = b'TCPE'
+VERSION = 1
+HEADER = struct.Struct('<4sHHI')     # magic, version, number of hand classes, trials per matchup
+CLASS_NAME = struct.Struct('<4s')
+FLOAT = struct.Struct('<f')
+
+
+
+def hand_classes():
+    ''' The 169 starting hand classes, strongest ranks first: pairs 'AA', suited 'AKs' and offsuit 'AKo' '''
+    classes = []
+    for i, high in enumerate(reversed(RANKS)):
+        for low in list(reversed(RANKS))[i:]:
+            if high == low:
+                classes.append(high + low)
+            else:
+                classes.extend([high + low + 's', high + low + 'o'])
+    return classes
+
+
+def hand_class(cards):
+    ''' Starting hand class of two hole cards, ['K♥', 'A♥'] -> 'AKs' '''
+    high, low = sorted(cards, key=lambda card: CARD_RANKS[card[:-1]], reverse=True)
+    if high[:-1] == low[:-1]:
+        return high[:-1] + low[:-1]
+    return high[:-1] + low[:-1] + ('s' if high[-1] == low[-1] else 'o')
+
+
+def class_combos(name):
+    ''' Every pair of concrete hole cards in a hand class. 6 for pairs, 4 suited, 12 offsuit '''
+    high, low = name[0], name[1]
+    if len(name) == 2:
+        return [(high + a, low + b) for i, a in enumerate(SUITS) for b in SUITS[i + 1:]]
+    if name[2] == 's':
+        return [(high + suit, low + suit) for suit in SUITS]
+    return [(high + a, low + b) for a in SUITS for b in SUITS if a != b]
+
+
+def matchup_equity(class_a, class_b, trials, rng):
+    ''' Monte Carlo equity of class_a against class_b, ties count as half a win '''
+    combos_a, combos_b = class_combos(class_a), class_combos(class_b)
+    deck = [rank + suit for suit in SUITS for rank in RANKS]
+    won = 0.0
+    for _ in range(trials):
+        while True:
+            hand_a, hand_b = rng.choice(combos_a), rng.choice(combos_b)
+            if not set(hand_a) & set(hand_b):
+                break
+        dead = set(hand_a) | set(hand_b)
+        board = rng.sample([card for card in deck if card not in dead], 5)
+        score_a, score_b = solve(list(hand_a) + board)[1], solve(list(hand_b) + board)[1]
+        won += 1.0 if score_a > score_b else 0.5 if score_a == score_b else 0.0
+    return won / trials
+
+
+def build_row(classes, row, trials, seed):
+    ''' Equities of classes[row] against every class after it, run in a worker process '''
+    rng = random.Random(f"{seed}-{row}")
+    return [matchup_equity(classes[row], opponent, trials, rng) for opponent in classes[row + 1:]]
+
+
+def build_table(path=EQUITY_FILE, trials=200, classes=None, seed=0, workers=None):
+    ''' Offline build step. Computes the class-vs-class equity matrix and writes it to path.
+        File layout: header, class names, each class's equity against a random hand, then the matrix by row '''
+    classes = classes or hand_classes()
+    n = len(classes)
+    matrix = [[0.5] * n for _ in range(n)]     # A class against itself is always a coin flip
+    with ProcessPoolExecutor(workers) as pool:
+        rows = pool.map(build_row, [classes] * n, range(n), [trials] * n, [seed] * n)
+        for row, equities in enumerate(rows):
+            for column, equity in enumerate(equities, row + 1):
+                matrix[row][column] = equity
+                matrix[column][row] = 1.0 - equity
+
+    # Equity against a random hand weights each opponent class by how many ways it can be dealt
+    weights = [len(class_combos(name)) for name in classes]
+    vs_random = [sum(w * e for w, e in zip(weights, row)) / sum(weights) for row in matrix]
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, n, trials))
+        for name in classes:
+            f.write(CLASS_NAME.pack(name.encode()))
+        for equity in vs_random:
+            f.write(FLOAT.pack(equity))
+        for row in matrix:
+            for equity in row:
+                f.write(FLOAT.pack(equity))
+    return path
+
+
+
+class EquityTable:
+    ''' Read-only view of a table written by build_table(). The file is memory-mapped,
+        so loading only reads the header and class names, and lookups read single values '''
+    def __init__(self, path=EQUITY_FILE):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.trials = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} equity table.")
+        names_offset = HEADER.size
+        self.classes = [CLASS_NAME.unpack_from(self.data, names_offset + i * CLASS_NAME.size)[0].rstrip(b'\0').decode()
+                        for i in range(self.size)]
+        self.index = {name: i for i, name in enumerate(self.classes)}
+        self.vs_random_offset = names_offset + self.size * CLASS_NAME.size
+        self.matrix_offset = self.vs_random_offset + self.size * FLOAT.size
+
+    def class_index(self, hand):
+        ''' Accepts a class name ('AKs') or two hole cards '''
+        return self.index[hand if isinstance(hand, str) else hand_class(hand)]
+
+    def equity(self, hand, opponent=None):
+        ''' Preflop equity of hand against an opponent's hand or class, or against a random hand if opponent is None '''
+        row = self.class_index(hand)
+        if opponent is None:
+            return FLOAT.unpack_from(self.data, self.vs_random_offset + row * FLOAT.size)[0]
+        column = self.class_index(opponent)
+        return FLOAT.unpack_from(self.data, self.matrix_offset + (row * self.size + column) * FLOAT.size)[0]
+
+    def rankings(self):
+        ''' Hand classes from strongest to weakest against a random hand '''
+        return sorted(self.classes, key=self.equity, reverse=True)
+
+    def close(self):
+        self.data.close()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCPoker preflop equity tables")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Compute the equity table. Takes a while, it only needs to be done once.')
+    build.add_argument('-o', '--output', default=EQUITY_FILE, help='File to write the table to.')
+    build.add_argument('-t', '--trials', type=int, default=200, help='Monte Carlo trials per matchup.')
+    build.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes.')
+    build.add_argument('--seed', type=int, default=0, help='Random seed, the same seed and trials give the same table.')
+    lookup = commands.add_parser('lookup', help='Look up the equity of one hand class against another, or a random hand.')
+    lookup.add_argument('hand', help='Hand class, such as AKs, QQ or 72o.')
+    lookup.add_argument('opponent', nargs='?', default=None, help='Opponent hand class.')
+    lookup.add_argument('-f', '--file', default=EQUITY_FILE, help='Equity table to read.')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        build_table(args.output, args.trials, seed=args.seed, workers=args.workers)
+        print(f"Wrote {args.output} in {time.perf_counter() - start:.1f}s")
+    else:
+        table = EquityTable(args.file)
+        print(f"{args.hand} vs {args.opponent or 'random'}: {table.equity(args.hand, args.opponent):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+from itertools import combinations
+from collections import Counter
+
+
+SUITS = ['♠', '♥', '♦', '♣']
+RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
+
+# Rank of each card character, built once instead of on every evaluation
+CARD_RANKS = {str(n): n for n in range(2, 10)}
+CARD_RANKS.update({'T': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14})
+
+# Name of each hand category, indexed by the first element of evaluate_hand()'s result
+HAND_RANKINGS = [
+    "High Card", "One Pair", "Two Pair", "Three of a Kind",
+    "Straight", "Flush", "Full House", "Four of a Kind",
+    "Straight Flush", "Royal Flush"
+]
+
+
+
+def evaluate_hand(hand):
+    ''' Evaluates a hand and returns its rank and relevant cards for tie-breaking '''
+    # Extract ranks and suits from hand
+    ranks = sorted([CARD_RANKS[card[:-1]] for card in hand], reverse=True)
+    suits = [card[-1] for card in hand]
+
+    # Check for a flush
+    is_flush = len(set(suits)) == 1
+
+    # Check for a straight
+    is_straight = ranks == list(range(ranks[0], ranks[0] - 5, -1))
+
+    # Check for an ace-low straight
+    if ranks == [14, 5, 4, 3, 2]:
+        is_straight = True
+        ranks = [5, 4, 3, 2, 1]
+
+    # Count occurrences of each rank
+    rank_counts = Counter(ranks).most_common()
+
+    # Determine hand type based on rank counts and other checks
+    if is_flush and is_straight:
+        return (9 if ranks[0] == 14 else 8, ranks)  # Royal flush or Straight flush
+
+    elif rank_counts[0][1] == 4:
+        return (7, [rank_counts[0][0], rank_counts[1][0]])  # Four of a kind
+
+    elif rank_counts[0][1] == 3 and rank_counts[1][1] == 2:
+        return (6, [rank_counts[0][0], rank_counts[1][0]])  # Full house
+
+    elif is_flush:
+        return (5, ranks)   # Flush
+
+    elif is_straight:
+        return (4, ranks)   # Straight
+
+    elif rank_counts[0][1] == 3:
+        return (3, [rank_counts[0][0]] + sorted([rank for rank, count in rank_counts if count == 1], reverse=True))     # Three of a kind
+
+    elif rank_counts[0][1] == 2 and rank_counts[1][1] == 2:
+        return (2, sorted([rank_counts[0][0], rank_counts[1][0]], reverse=True) + [rank_counts[2][0]])  # Two pair
+
+    elif rank_counts[0][1] == 2:
+        return (1, [rank_counts[0][0]] + sorted([rank for rank, count in rank_counts if count == 1], reverse=True))     # One pair
+
+    else:
+        return (0, ranks)   # High card
+
+
+def get_best_hand(cards):
+    ''' Algorithmically determines the best 5-card poker hand from players 2 hand cards + 5 community cards '''
+    return solve(cards)[0]
+
+
+def solve(cards):
+    ''' Returns (best 5-card hand, evaluate_hand score) for 5 or more cards. A 5-card hand is only evaluated '''
+    if len(cards) < 5:
+        raise ValueError(f"A poker hand needs at least 5 cards, got {len(cards)}.")
+    best_score = (-1, [])
+    best_hand = []
+
+    for hand in combinations(cards, 5):
+        score = evaluate_hand(hand)
+        if score > best_score:
+            best_score = score
+            best_hand = hand
+    return best_hand, best_score
+
+
+def solve_batch(card_sets):
+    ''' solve() for many card sets at once, so a worker pool can answer a whole batch in one call '''
+    return [solve(cards) for cards in card_sets]
+
+
+def warm_up():
+    ''' Worker pool initializer. Runs one evaluation so the module and its tables are loaded before the first request '''
+    solve(['A♠', 'K♠', 'Q♠', 'J♠', 'T♠', '2♥', '3♦'])
+
+
+# Bit masks of the 10 possible straights, the ace is also bit 1 so the wheel (A-5) is a straight
+STRAIGHT_MASKS = [0b11111 << low for low in range(10, 0, -1)]
+
+
+def rank_bit(rank):
+    ''' Bit for a rank in a rank mask. Aces set both their high and low bits '''
+    return (1 << rank) | (2 if rank == 14 else 0)
+
+
+def top_straight(mask):
+    ''' Returns the high card of the best straight in a rank mask, or 0 '''
+    for straight in STRAIGHT_MASKS:
+        if mask & straight == straight:
+            return straight.bit_length() - 1
+    return 0
+
+
+
+class HandState:
+    ''' Incremental hand strength for one player, updated as hole and community cards are dealt.
+        Keeps rank/suit counts so the made hand category, the best 5-card hand and draw outs are cheap to update on each
+        card, without evaluating every 5-card combination the way solve() does '''
+    def __init__(self, cards=()):
+        self.cards = []
+        self.rank_counts = [0] * 15
+        self.rank_cards = [[] for _ in range(15)]   # Cards held of each rank, in the order they were dealt
+        self.suit_counts = dict.fromkeys(SUITS, 0)
+        self.rank_mask = 0
+        self.suit_masks = dict.fromkeys(SUITS, 0)
+        self.category = None
+        self.best_hand = ()
+        self.score = None
+        self.outs = 0
+        self.add(*cards)
+
+    def add(self, *cards):
+        ''' Adds newly dealt cards and brings the rest of the state up to date '''
+        for card in cards:
+            rank, suit = CARD_RANKS[card[:-1]], card[-1]
+            self.cards.append(card)
+            self.rank_counts[rank] += 1
+            self.rank_cards[rank].append(card)
+            self.suit_counts[suit] += 1
+            self.rank_mask |= rank_bit(rank)
+            self.suit_masks[suit] |= rank_bit(rank)
+        if not self.cards:
+            return
+        self.category = self.made_category(self.rank_counts, self.suit_counts, self.rank_mask, self.suit_masks)
+        if len(self.cards) >= 5:
+            self.best_hand, self.score = self.made_hand()
+        self.outs = self.count_outs() if len(self.cards) < 7 else 0
+
+    @staticmethod
+    def made_category(rank_counts, suit_counts, rank_mask, suit_masks):
+        ''' Hand category (index into HAND_RANKINGS) made by the cards so far '''
+        straight_flush = max(top_straight(mask) for mask in suit_masks.values())
+        if straight_flush:
+            return 9 if straight_flush == 14 else 8
+        counts = sorted(rank_counts, reverse=True)
+        if counts[0] == 4:
+            return 7
+        if counts[0] == 3 and counts[1] >= 2:
+            return 6
+        if max(suit_counts.values()) >= 5:
+            return 5
+        if top_straight(rank_mask):
+            return 4
+        if counts[0] == 3:
+            return 3
+        if counts[0] == 2 and counts[1] == 2:
+            return 2
+        if counts[0] == 2:
+            return 1
+        return 0
+
+    def made_hand(self):
+        ''' The best 5-card hand and the score evaluate_hand() gives it, read off the counts for the category made.
+            Between cards of the same rank, the first dealt is used '''
+        category, counts, rank_cards = self.category, self.rank_counts, self.rank_cards
+        ranks = [rank for rank in range(14, 1, -1) if counts[rank]]     # Each rank held, highest first
+        kickers = lambda used, n: [rank for rank in ranks if rank not in used][:n]
+
+        if category in (8, 9, 4):
+            if category == 4:
+                high, card_of = top_straight(self.rank_mask), lambda rank: rank_cards[rank][0]
+            else:
+                suit, high = max(((suit, top_straight(mask)) for suit, mask in self.suit_masks.items()), key=lambda x: x[1])
+                card_of = lambda rank: next(card for card in rank_cards[rank] if card[-1] == suit)
+            score = list(range(high, high - 5, -1))     # The wheel's ace counts as 1
+            hand = [card_of(14 if rank == 1 else rank) for rank in score]
+        elif category == 7:
+            quads = next(rank for rank in ranks if counts[rank] == 4)
+            score = [quads] + kickers([quads], 1)
+            hand = rank_cards[quads] + [rank_cards[score[1]][0]]
+        elif category == 6:
+            trips = next(rank for rank in ranks if counts[rank] == 3)
+            pair = next(rank for rank in ranks if rank != trips and counts[rank] >= 2)
+            score = [trips, pair]
+            hand = rank_cards[trips] + rank_cards[pair][:2]
+        elif category == 5:
+            suit = next(suit for suit, count in self.suit_counts.items() if count >= 5)
+            hand = sorted((card for card in self.cards if card[-1] == suit), key=lambda card: CARD_RANKS[card[:-1]], reverse=True)[:5]
+            score = [CARD_RANKS[card[:-1]] for card in hand]
+        else:
+            # Pairs, two pair, trips and high card: the matched ranks, then the highest kickers
+            matched = {3: 1, 2: 2, 1: 1, 0: 0}[category]
+            size = 3 if category == 3 else 2
+            made = [rank for rank in ranks if counts[rank] == size][:matched]
+            score = made + kickers(made, 5 - size * len(made))
+            hand = [card for rank in made for card in rank_cards[rank]] + [rank_cards[rank][0] for rank in score[len(made):]]
+        return tuple(sorted(hand, key=self.cards.index)), (category, score)
+
+    def count_outs(self):
+        ''' Number of unseen cards that would complete a straight or flush the hand doesn't already have '''
+        if self.category >= 4:
+            return 0
+        flush_suits = [suit for suit, count in self.suit_counts.items() if count == 4]
+        outs = 0
+        for rank in range(2, 15):
+            if top_straight(self.rank_mask | rank_bit(rank)):
+                outs += 4 - self.rank_counts[rank]      # Every unseen card of the rank
+            else:
+                outs += sum(1 for suit in flush_suits if not self.suit_masks[suit] >> rank & 1)
+        return outs
+
+    def summary(self):
+        ''' The player's current hand, as sent to clients in the 'current_hand' field '''
+        return {
+            "name": HAND_RANKINGS[self.category],
+            "cards": list(self.best_hand),
+            "outs": self.outs
+        }
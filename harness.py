@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from admission import AdmissionControl
+from bots import fallback
+from equity import EquityTable
+from evaluator import get_best_hand
+from headless import HeadlessClient
+from server import TCPokerServer
+
+
+SCENARIO_TIMEOUT = 10.0     # Seconds a scenario may run before it's reported as stalled
+REPLY_TIMEOUT = 2.0     # Seconds replay() waits for each frame the recording says the server sent
+
+
+
+class MemoryWriter:
+    ''' StreamWriter stand-in that feeds everything written straight into the peer's StreamReader '''
+    def __init__(self, peer_reader, peername):
+        self.peer_reader = peer_reader
+        self.peername = peername
+        self.closed = False
+
+    def write(self, data):
+        if not self.closed:
+            self.peer_reader.feed_data(data)
+
+    async def drain(self):
+        if self.closed:
+            raise ConnectionResetError("Connection lost")
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.peer_reader.feed_eof()
+
+    def is_closing(self):
+        return self.closed
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return self.peername if name == 'peername' else default
+
+
+
+def memory_connection(client_connected_cb, peername, limit=2 ** 16):
+    ''' Connects a client to a server's client_connected_cb (such as TCPokerServer.handle_client) without a socket.
+        Returns the client's (reader, writer) and the server side task '''
+    client_reader, server_reader = asyncio.StreamReader(limit=limit), asyncio.StreamReader(limit=limit)
+    client_writer, server_writer = MemoryWriter(server_reader, ('server', 0)), MemoryWriter(client_reader, peername)
+    task = asyncio.create_task(client_connected_cb(server_reader, server_writer))
+    # The server closing its side is the client's end of stream, and the other way round
+    task.add_done_callback(lambda _: server_writer.close())
+    return client_reader, client_writer, task
+
+
+def make_server(seed=None, solver=False, current_hand=False, admission=None):
+    ''' A TCPokerServer for the harness. Without an AdmissionControl, admission limits are lifted, since scripted clients
+        send far faster than people '''
+    if admission is None:
+        admission = AdmissionControl(max_connections=10 ** 6, max_per_ip=10 ** 6, rate=10 ** 9, burst=10 ** 9)
+    game = TCPokerServer(seed=seed, admission=admission)
+    game.solver = solver
+    game.show_current_hand = current_hand
+    return game
+
+
+
+class RecordedBots:
+    ''' Stands in for a BotPool in replay(), playing back the decisions the recorded bots made, in order. Live decisions
+        depend on how much CPU time the rollouts got, so they can't be made again '''
+    def __init__(self, decisions):
+        self.decisions = deque(decisions)   # [name, action, amount] from the recording's "bot" events
+
+    async def decide(self, hole_cards, community_cards, valid_actions, *_):
+        if not self.decisions:
+            return fallback(valid_actions)
+        _, action, amount = self.decisions.popleft()
+        return action, amount
+
+
+
+class ScriptedPlayer(HeadlessClient):
+    ''' A HeadlessClient that plays a scenario. Each hand's actions (such as 'bet 20') are used in order whenever the
+        player is asked to bet, once they run out it checks, or calls, or folds. Antes and best hands are automatic '''
+    def __init__(self, username, hands, transcript):
+        super().__init__(None, None, username)
+        self.hands = [list(actions) for actions in hands]
+        self.hand_number = 0
+        self.transcript = transcript    # (username, message) for every message received, shared by the session
+
+    async def handle_message(self, message):
+        self.transcript.append((self.username, message))
+        action = message.get("action")
+        if action == "collect_ante":
+            await self.send_command('ante', message["amount"])
+        elif action == "collect_bets":
+            await self.send_command(*self.next_action())
+        elif action == "collect_hands":
+            await self.send_command('hand', *self.best_hand())
+        elif message.get("game_state") == "lobby":
+            self.hand_number += 1
+            if self.hand_number < len(self.hands):
+                await self.send_command('ready')
+            else:
+                await self.send_command('exit')
+                await self.close()
+
+    def next_action(self):
+        script = self.hands[self.hand_number] if self.hand_number < len(self.hands) else []
+        if script:
+            return script.pop(0).split()
+        for default in ('check', 'call', 'fold'):
+            if default in self.valid_commands:
+                return [default]
+        return ['fold']
+
+    def best_hand(self):
+        ''' The best hand as positions in the hand command, such as ['c1', 'c2', 'c3', 'h1', 'h2'] '''
+        positions = {card: f"h{i + 1}" for i, card in enumerate(self.hand)}
+        positions.update({card: f"c{i + 1}" for i, card in enumerate(self.community_cards)})
+        return [positions[card] for card in get_best_hand(self.hand + self.community_cards)]
+
+
+
+async def run_scenario(scenario, timeout=SCENARIO_TIMEOUT, recorder=None):
+    ''' Plays a scenario through handle_client, start_game and determine_winner over in-memory connections. A scenario is
+            {"seed": 7, "solver": true, "players": ["adam", "betty"],
+             "hands": [{"adam": ["bet 20"], "betty": ["call"]}, ...],
+             "expect": {"stacks": {"adam": 120, "betty": 80}}}
+        where everything but "players" and "hands" is optional. Returns {"stacks", "transcript", "failures"}, failures lists
+        expectations that weren't met, or that the session stalled. A recording.SessionRecorder captures the session for replay() '''
+    game = make_server(scenario.get("seed"), scenario.get("solver", False), scenario.get("current_hand", False))
+    game.recorder = recorder
+    names = scenario["players"]
+    transcript = []
+    players = [ScriptedPlayer(name, [hand.get(name, []) for hand in scenario["hands"]], transcript) for name in names]
+    tasks = []
+    seated = []
+    failures = []
+    try:
+        for i, player in enumerate(players):
+            player.reader, player.writer, task = memory_connection(game.handle_client, (f"memory-{i}", 0))
+            tasks.append(task)
+            await player.send_message({"username": player.username})
+            await player.send_command('ready')
+        while len(game.players) < len(players) and not all(task.done() for task in tasks):
+            await asyncio.sleep(0)
+        seated = list(game.players)
+        await asyncio.wait_for(asyncio.gather(*(player.receive_messages() for player in players)), timeout)
+    except asyncio.TimeoutError:
+        failures.append(f"Stalled after {timeout}s, last message: {transcript[-1] if transcript else None}")
+    finally:
+        for player in players:
+            await player.close()
+        game.cleanup()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    stacks = {player.name: player.stack for player in seated}
+    for name, stack in scenario.get("expect", {}).get("stacks", {}).items():
+        if stacks.get(name) != stack:
+            failures.append(f"Expected {name} to finish with {stack}, they have {stacks.get(name)}")
+    return {"stacks": stacks, "transcript": transcript, "failures": failures}
+
+
+async def replay(path, realtime=False, timeout=REPLY_TIMEOUT):
+    ''' Plays a session captured with the server's --record flag against a fresh server with the same seed and options.
+        Each frame a client sent is sent once the server has sent everything it sent before it, so the recorded order is
+        kept. With realtime, the recorded gaps between frames are kept too. Returns the divergences between what the
+        server sends now and the recording, as (event number, connection, recorded frame, frame sent now).
+        The recorded admission limits are restored, with rate limits measured on the recorded clock so the same frames
+        are refused, and bots play back their recorded decisions. Admin channel commands aren't recorded '''
+    with open(path, encoding='utf-8') as f:
+        header, *events = [json.loads(line) for line in f]
+    now = 0.0   # Recorded time of the event being replayed
+    limits = header.get("admission")
+    admission = AdmissionControl(**limits, clock=lambda: now) if limits else None
+    game = make_server(header["seed"], header["solver"], header["current_hand"], admission)
+    if header.get("equity_table"):
+        game.equity_table = EquityTable(header["equity_table"])
+    if header.get("bots"):
+        game.bots = RecordedBots(event["data"] for event in events if event["event"] == "bot")
+    connections = {}
+    tasks = []
+    divergences = []
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        for number, event in enumerate(events):
+            if realtime:
+                await asyncio.sleep(max(0.0, event["t"] - (loop.time() - start)))
+            now = event["t"]
+            conn, kind = event["conn"], event["event"]
+            if kind == "open":
+                reader, writer, task = memory_connection(game.handle_client, tuple(event["data"] or ("memory", conn)))
+                connections[conn] = (reader, writer)
+                tasks.append(task)
+            elif kind == "recv":
+                connections[conn][1].write(event["data"].encode())
+            elif kind == "close":
+                connections[conn][1].close()
+            elif kind == "send":
+                try:
+                    sent = (await asyncio.wait_for(connections[conn][0].readline(), timeout)).decode()
+                except asyncio.TimeoutError:
+                    sent = None
+                if sent != event["data"]:
+                    divergences.append((number, conn, event["data"], sent))
+            await asyncio.sleep(0)      # Let the server handle the frame before the next event
+    finally:
+        for _, writer in connections.values():
+            writer.close()
+        game.cleanup()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return divergences
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCPoker scenario and replay harness")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='Run scenarios from a JSON file holding one scenario or a list of them.')
+    run.add_argument('file')
+    replay_parser = commands.add_parser('replay', help='Replay a session recorded with server.py --record.')
+    replay_parser.add_argument('file')
+    replay_parser.add_argument('--realtime', action='store_true', help='Keep the recorded time between frames.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'run':
+        with open(args.file, encoding='utf-8') as f:
+            scenarios = json.load(f)
+        if isinstance(scenarios, dict):
+            scenarios = [scenarios]
+        failed = 0
+        for i, scenario in enumerate(scenarios):
+            result = asyncio.run(run_scenario(scenario))
+            if result["failures"]:
+                failed += 1
+                print(f"Scenario {i} failed: " + "; ".join(result["failures"]))
+        print(f"{len(scenarios) - failed}/{len(scenarios)} scenarios passed in {time.perf_counter() - start:.2f}s")
+    else:
+        divergences = asyncio.run(replay(args.file, args.realtime))
+        for number, conn, recorded, sent in divergences[:20]:
+            print(f"Event {number}, connection {conn}:\n  recorded {recorded!r}\n  replayed {sent!r}")
+        print(f"{len(divergences)} divergences, replayed in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+from transport import open_frame_connection
+
+
+LOBBY_COMMANDS = ['ready', 'status', 'exit']
+
+
+
+class HeadlessClient:
+    ''' Protocol side of a TCPoker client, with no terminal UI. Connects, sends commands and tracks the
+        state the server sends (valid commands, cards, stack). Messages are consumed either by passing an
+        on_message callback and running receive_messages(), or by iterating over messages() '''
+    def __init__(self, host, port, username, transport='streams', on_message=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.transport = transport
+        self.on_message = on_message    # Called as on_message(client, message), may be a coroutine function
+        self.reader = None
+        self.writer = None
+        self.valid_commands = list(LOBBY_COMMANDS)
+        self.game_started = False
+        self.hand = []
+        self.community_cards = []
+        self.current_hand = None
+        self.stack = None
+        self.pot = 0
+        self.to_call = 0
+
+
+    async def connect(self):
+        ''' Opens the connection and joins the server with the client's username '''
+        if self.transport == 'protocol':
+            self.reader, self.writer = await open_frame_connection(self.host, self.port)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        logging.info(f"Connected to server at {self.host}:{self.port}")
+        await self.send_message({"username": self.username})
+
+
+    async def send_message(self, message):
+        ''' Sends a message to server using clients StreamWriter '''
+        try:
+            self.writer.write((json.dumps(message) + "\n").encode())        # All messages end with '\n' delimiter
+            await self.writer.drain()
+            logging.info(f"{self.username} Sent: {message}")
+        except Exception as e:
+            logging.error(f"Failed to send message: {e}")
+
+
+    async def send_command(self, *parts):
+        ''' Sends a command, such as send_command('bet', '20') '''
+        await self.send_message({"command": [str(part) for part in parts]})
+
+
+    async def messages(self):
+        ''' Async iterator over messages from the server, each applied to the client state before it is yielded.
+            Ends when the server closes the connection '''
+        while True:
+            data = await self.reader.readline()
+            if not data:
+                logging.info("Server closed the connection.")
+                return
+            message = json.loads(data)
+            logging.info(f"{self.username} received message: {message}")
+            self.apply(message)
+            yield message
+
+
+    async def receive_messages(self):
+        ''' Receives messages until the server closes the connection, handing each to handle_message() '''
+        try:
+            async for message in self.messages():
+                await self.handle_message(message)
+        except Exception as e:
+            logging.error(f"Error receiving message: {e}")
+
+
+    async def handle_message(self, message):
+        ''' Called with each message after the client state has been updated. Subclasses override this '''
+        if self.on_message:
+            result = self.on_message(self, message)
+            if asyncio.iscoroutine(result):
+                await result
+
+
+    def apply(self, message):
+        ''' Updates the client state from a server message '''
+        if "hand" in message:
+            self.hand = message["hand"]
+            self.current_hand = message.get("current_hand")
+
+        elif "stack" in message:
+            self.stack = message["stack"]
+
+        elif "start_game" in message:
+            self.game_started = True
+
+        elif "action" in message:
+            if message["action"] == "collect_ante":
+                self.valid_commands = ['ante']
+
+            elif message["action"] == "collect_bets":
+                self.valid_commands = message["valid_actions"]
+                self.pot = message["pot"]
+                self.to_call = message["to_call"]
+
+            elif message["action"] == "collect_hands":
+                self.valid_commands = ['hand']
+
+            elif message["action"] == "clear_prompt":
+                self.valid_commands = []
+
+        elif "game_state" in message:
+            if message["game_state"] == "lobby":
+                self.game_started = False
+                self.valid_commands = list(LOBBY_COMMANDS)
+                self.hand = []
+                self.community_cards = []
+                self.current_hand = None
+
+        elif "community_cards" in message:
+            self.community_cards = message["community_cards"]
+
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            await self.writer.wait_closed()
@@ -1,10 +1,35 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
 import unittest
-from server import Player, TCPokerServer
+from concurrent.futures import ThreadPoolExecutor
+from poker import Player, PokerTable
+from server import TCPokerServer, parse_args
+from admission import AdmissionControl, TokenBucket, check_frame
+from transport import FrameBuffer
+from workers import WorkerPool
+from evaluator import HandState, HAND_RANKINGS
+import evaluator
+from client import render_cards
+from headless import HeadlessClient
+from harness import ScriptedPlayer, make_server, memory_connection, replay, run_scenario
+from recording import SessionRecorder
+from bots import BotPlayer, BotPool, decide
+from deck import CARDS, Deck, deal_batch
+from admin import AdminChannel, send_command, start_admin_server
+from watchdog import LoopWatchdog
+from analytics import HandLog, HandRecord, np, player_names, pot_distribution, vpip, win_rate_by_class
+from checkpoint import Checkpointer, load, restore, snapshot
+from equity import EquityTable, build_table, class_combos, hand_class, hand_classes
 
 class TestPoker(unittest.TestCase):
     def setUp(self):
-        self.game = TCPokerServer()
-        self.game.game_active = True
+        self.game = PokerTable()
         client1 = Player("adam", None)
         client2 = Player("betty", None)
         self.game.players.append(client1)
@@ -119,6 +144,813 @@ class TestPoker(unittest.TestCase):
         self.assertEqual(self.game.best_hands[self.game.players[0]], ('K♥', '7♠', '6♣', 'A♣', 'T♣'))
         self.assertEqual(self.game.best_hands[self.game.players[1]], ('J♥', '7♠', '6♣', 'A♣', 'T♣'))
         
+    def test_parse_hand_rejects_malformed_hands(self):
+        ''' Test a hand command must pick 5 different cards that exist, rather than being scored as something it isn't '''
+        adam = self.game.players[0]
+        adam.hand = ['K♥', '4♠']
+        self.game.community_cards = ['2♠', '7♠', '6♣', 'A♣', 'T♣']
+
+        self.assertEqual(self.game.parse_hand(adam, ['hand', 'c1', 'c2', 'C3', 'h1', 'h2']), ['2♠', '7♠', '6♣', 'K♥', '4♠'])
+        for command in (['hand', 'c1', 'c2', 'h1'], ['hand', 'c1', 'c1', 'c2', 'h1', 'h2'], ['hand', 'c1', 'c2', 'c3', 'h1', 'h3'],
+                        ['hand', 'c0', 'c2', 'c3', 'h1', 'h2'], ['hand', 'x1', 'c2', 'c3', 'h1', 'h2']):
+            with self.assertRaises(ValueError):
+                self.game.parse_hand(adam, command)
+        with self.assertRaises(ValueError):
+            evaluator.solve(['K♥', '4♠', '2♠', '7♠'])
+
+
+class TestAdmission(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.clock = lambda: self.now
+
+    def test_token_bucket_refills(self):
+        ''' Test a token bucket rejects once its burst is spent, and recovers at its refill rate '''
+        bucket = TokenBucket(rate=2, capacity=3, clock=self.clock)
+        self.assertTrue(all(bucket.consume() for _ in range(3)))
+        self.assertFalse(bucket.consume())
+        self.now += 0.5     # One token refilled
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+
+    def test_check_frame(self):
+        ''' Test malformed and oversized frames are rejected before json.loads '''
+        self.assertIsNone(check_frame(b'{"command": ["ready"]}\n'))
+        self.assertEqual(check_frame(b'\n'), "Empty message.")
+        self.assertEqual(check_frame(b'["ready"]\n'), "Invalid message format.")
+        self.assertEqual(check_frame(b'{"username": "' + b'a' * 100 + b'"}\n', max_frame=64), "Message too large.")
+
+    def test_frame_bound_matches_read_limit(self):
+        ''' Test check_frame and the StreamReader limit accept and refuse the same frame sizes, not counting the '\n' '''
+        async def read(frame):
+            reader = asyncio.StreamReader(limit=64)
+            reader.feed_data(frame)
+            try:
+                return await reader.readline()
+            except ValueError:
+                return None
+
+        largest = b'{"a": "' + b'a' * 55 + b'"}\n'
+        self.assertEqual(len(largest), 65)
+        self.assertEqual(asyncio.run(read(largest)), largest)
+        self.assertIsNone(check_frame(largest, max_frame=64))
+        too_large = largest.replace(b'a"', b'aa"')
+        self.assertIsNone(asyncio.run(read(too_large)))
+        self.assertEqual(check_frame(too_large, max_frame=64), "Message too large.")
+
+    def test_connection_caps(self):
+        ''' Test total and per-IP connection caps, and that closed connections free their slot '''
+        admission = AdmissionControl(max_connections=3, max_per_ip=2, clock=self.clock)
+        self.assertTrue(admission.admit('1.1.1.1'))
+        self.assertTrue(admission.admit('1.1.1.1'))
+        self.assertFalse(admission.admit('1.1.1.1'))
+        self.assertTrue(admission.admit('2.2.2.2'))
+        self.assertFalse(admission.admit('3.3.3.3'))
+        admission.release('2.2.2.2')
+        self.assertTrue(admission.admit('3.3.3.3'))
+
+    def test_player_rate_limit(self):
+        ''' Test a flooding player is limited without using up their IP's budget for other players '''
+        admission = AdmissionControl(rate=1, burst=2, max_per_ip=2, clock=self.clock)
+        self.assertTrue(admission.allow_command('1.1.1.1', 'adam'))
+        self.assertTrue(admission.allow_command('1.1.1.1', 'adam'))
+        for _ in range(10):
+            self.assertFalse(admission.allow_command('1.1.1.1', 'adam'))
+        # The IP's bucket holds 4, adam's refused commands didn't take any of betty's share
+        self.assertTrue(admission.allow_command('1.1.1.1', 'betty'))
+        self.assertTrue(admission.allow_command('1.1.1.1', 'betty'))
+        self.assertFalse(admission.allow_command('1.1.1.1', 'betty'))
+
+    def test_flood_gets_one_notice(self):
+        ''' Test a flooding client is told once per throttle window, and the rest of its frames are dropped without a reply '''
+        async def run():
+            game = TCPokerServer(admission=AdmissionControl(rate=1, burst=2, clock=self.clock))
+            reader, writer, task = memory_connection(game.handle_client, ('1.1.1.1', 0))
+            writer.write(b'{"username": "adam"}\n' + b'{"command": ["status"]}\n' * 20 + b'not json\n' * 20)
+            for _ in range(1000):
+                if game.admission.throttled.get('adam', 0) >= 38:    # 2 commands allowed, then 18 commands and 20 junk frames refused
+                    break
+                await asyncio.sleep(0)
+            self.now += 1.0     # The window ends once a token has refilled
+            writer.write(b'{"command": ["status"]}\n')
+            writer.close()
+            await task
+            replies = []
+            while line := await reader.readline():
+                replies.append(json.loads(line))
+            return replies
+
+        replies = asyncio.run(run())
+        errors = [reply["error"] for reply in replies if "error" in reply]
+        self.assertEqual(errors, ["Rate limit exceeded, slow down."])
+        self.assertEqual(sum("status" in reply for reply in replies), 3)
+
+
+class TestFrameBuffer(unittest.TestCase):
+    def test_frames_split_across_reads(self):
+        ''' Test frames are reassembled when they arrive split across, or packed into, reads '''
+        buffer = FrameBuffer(max_frame=64)
+        self.assertEqual(buffer.feed(b'{"command": ["re'), [])
+        self.assertEqual(buffer.feed(b'ady"]}\n{"command": ["status"]}\n{"comm'), [b'{"command": ["ready"]}\n', b'{"command": ["status"]}\n'])
+        self.assertEqual(buffer.feed(b'and": ["exit"]}\n'), [b'{"command": ["exit"]}\n'])
+
+    def test_oversized_frame(self):
+        ''' Test frames before an oversized frame are kept, and nothing after it is '''
+        buffer = FrameBuffer(max_frame=16)
+        self.assertEqual(buffer.feed(b'{"a": 1}\n' + b'x' * 32 + b'\n{"b": 2}\n'), [b'{"a": 1}\n'])
+        self.assertTrue(buffer.overflow)
+        self.assertEqual(buffer.feed(b'{"c": 3}\n'), [])
+
+
+def slow_solve_batch(card_sets):
+    time.sleep(0.2)
+    return [((), (-1, [])) for _ in card_sets]
+
+
+class TestWorkerPool(unittest.TestCase):
+    hole_cards = [['K♥', '4♠'], ['J♥', '3♣']]
+    community_cards = ['2♠', '7♠', '6♣', 'A♣', 'T♣']
+
+    def test_batched_showdowns(self):
+        ''' Test showdowns from several tables at once are answered correctly from a single pool call '''
+        async def run():
+            workers = WorkerPool('thread', max_workers=1)
+            calls = []
+            submit = workers.executor.submit
+            workers.executor.submit = lambda *args: calls.append(args) or submit(*args)
+            try:
+                tables = [[hand + self.community_cards for hand in self.hole_cards] for _ in range(3)]
+                return await asyncio.gather(*(workers.solve(table) for table in tables)), calls
+            finally:
+                workers.shutdown()
+
+        results, calls = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        for table in results:
+            self.assertEqual(table[0][0], ('K♥', '7♠', '6♣', 'A♣', 'T♣'))
+            self.assertEqual(table[1][0], ('J♥', '7♠', '6♣', 'A♣', 'T♣'))
+
+    def test_latency_budget_fallback(self):
+        ''' Test a pool that misses its latency budget is bypassed with an inline evaluation '''
+        async def run():
+            workers = WorkerPool('thread', max_workers=1, latency_budget=0.01)
+            workers.executor.submit = lambda func, *args: workers.executor.__class__.submit(workers.executor, slow_solve_batch, *args)
+            try:
+                return await workers.solve([self.hole_cards[0] + self.community_cards])
+            finally:
+                workers.shutdown()
+
+        self.assertEqual(asyncio.run(run())[0][0], ('K♥', '7♠', '6♣', 'A♣', 'T♣'))
+
+    def test_process_workers_do_not_inherit_sockets(self):
+        ''' Test process workers don't hold the server's sockets open, or clients closing their connection would never reach EOF '''
+        server_side, client_side = socket.socketpair()
+        workers = WorkerPool('process', max_workers=1)
+        try:
+            asyncio.run(workers.run(os.getpid))     # The worker is running while the server's socket is open
+            server_side.close()
+            client_side.settimeout(5)
+            self.assertEqual(client_side.recv(1), b'')
+        finally:
+            workers.shutdown()
+            server_side.close()
+            client_side.close()
+
+
+class TestHandState(unittest.TestCase):
+    def test_streets(self):
+        ''' Test the hand state follows a hand street by street, and matches get_best_hand on the river '''
+        game = PokerTable()
+        state = HandState(['K♥', 'K♠'])
+        self.assertEqual(HAND_RANKINGS[state.category], "One Pair")
+        state.add('Q♥', 'J♥', '2♣')
+        self.assertEqual(HAND_RANKINGS[state.category], "One Pair")
+        state.add('T♣')
+        self.assertEqual(HAND_RANKINGS[state.category], "One Pair")
+        self.assertEqual(state.outs, 8)     # Any ace or nine
+        state.add('A♥')
+        self.assertEqual(HAND_RANKINGS[state.category], "Straight")
+        cards = ['K♥', 'K♠', 'Q♥', 'J♥', '2♣', 'T♣', 'A♥']
+        self.assertEqual(state.best_hand, game.get_best_hand(cards))
+        self.assertEqual(state.score, game.evaluate_hand(state.best_hand))
+
+    def test_best_hand_matches_solve(self):
+        ''' Test the best hand read off the counts scores the same as solve() on every street, for random deals '''
+        rng = random.Random(7)
+        for _ in range(500):
+            cards = rng.sample(CARDS, 7)
+            state = HandState(cards[:2])
+            for dealt in (cards[2:5], cards[5:6], cards[6:7]):
+                state.add(*dealt)
+                self.assertEqual(state.score, evaluator.solve(state.cards)[1], state.cards)
+                self.assertEqual(evaluator.evaluate_hand(state.best_hand), state.score)
+                self.assertEqual(len(set(state.best_hand) & set(state.cards)), 5)
+
+    def test_outs(self):
+        ''' Test draw outs for flush, open-ended and gutshot straight draws, without counting overlapping cards twice '''
+        self.assertEqual(HandState(['A♠', 'K♠', '7♠', '2♠', '9♥']).outs, 9)      # Flush draw
+        self.assertEqual(HandState(['9♠', '8♥', '7♦', '6♣', '2♥']).outs, 8)      # Open-ended straight draw
+        self.assertEqual(HandState(['9♠', '8♥', '6♦', '5♣', '2♥']).outs, 4)      # Gutshot
+        self.assertEqual(HandState(['9♠', '8♠', '7♠', '6♠', '2♥']).outs, 15)     # Open-ended straight flush draw
+        self.assertEqual(HandState(['9♠', '8♠', '7♠', '6♠', '5♥']).outs, 0)      # Already a straight
+
+
+class TestEquityTable(unittest.TestCase):
+    def test_hand_classes(self):
+        ''' Test the 169 hand classes cover all 1326 starting hands '''
+        classes = hand_classes()
+        self.assertEqual(len(set(classes)), 169)
+        self.assertEqual(sum(len(class_combos(name)) for name in classes), 1326)
+        self.assertEqual(hand_class(['K♥', 'A♥']), 'AKs')
+        self.assertEqual(hand_class(['7♣', '2♦']), '72o')
+        self.assertEqual(hand_class(['Q♠', 'Q♦']), 'QQ')
+
+    def test_build_and_lookup(self):
+        ''' Test a table built for a few classes reads back consistently from its memory map '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = build_table(os.path.join(directory, 'equity.bin'), trials=200, classes=['AA', 'KQs', '72o'], workers=1)
+            table = EquityTable(path)
+            try:
+                self.assertEqual(table.classes, ['AA', 'KQs', '72o'])
+                self.assertEqual(table.equity('AA', 'AA'), 0.5)
+                self.assertAlmostEqual(table.equity('AA', '72o') + table.equity('72o', 'AA'), 1.0, places=5)
+                self.assertGreater(table.equity(['A♠', 'A♥'], ['7♣', '2♦']), 0.75)
+                self.assertEqual(table.rankings(), ['AA', 'KQs', '72o'])
+            finally:
+                table.close()
+
+
+class TestClientRendering(unittest.TestCase):
+    def test_render_cards(self):
+        ''' Test cards are drawn side by side in one string '''
+        self.assertEqual(render_cards(['A♠', 'T♥']), "\n".join([
+            ' ___   ___  ',
+            '|A  | |T  | ',
+            '| ♠ | | ♥ | ',
+            '|__A| |__T| '
+        ]))
+
+
+class TestHeadlessClient(unittest.TestCase):
+    def test_join_and_ready(self):
+        ''' Test two headless clients can join a real server, ready up, and are asked for the ante '''
+        async def run():
+            game = TCPokerServer()
+            server = await asyncio.start_server(game.handle_client, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            clients = [HeadlessClient('127.0.0.1', port, name) for name in ("adam", "betty")]
+
+            async def play(client):
+                await client.connect()
+                await client.send_command('ready')
+                async for message in client.messages():
+                    if message.get("action") == "collect_ante":
+                        return client.valid_commands
+
+            try:
+                return await asyncio.wait_for(asyncio.gather(*(play(client) for client in clients)), 5)
+            finally:
+                for client in clients:
+                    await client.close()
+                game.cleanup()
+                server.close()
+
+        self.assertEqual(asyncio.run(run()), [['ante'], ['ante']])
+
+
+class TestBots(unittest.TestCase):
+    def test_decisions(self):
+        ''' Test bots bet the nuts, and fold hopeless hands facing a large bet '''
+        self.assertEqual(decide(['A♠', 'A♥'], ['A♦', 'A♣', 'K♠'], ['check', 'bet'], 0, 40, 0, 100, 10, seed=1), ('bet', 20))
+        self.assertEqual(decide(['3♣', '2♦'], ['A♦', 'K♣', 'Q♠', 'J♥', '8♠'], ['call', 'raise', 'fold'], 40, 60, 40, 100, 10, seed=1), ('fold', 0))
+
+    def test_decision_budget(self):
+        ''' Test a decision stays close to its time budget '''
+        start = time.perf_counter()
+        action, _ = decide(['T♠', '9♠'], [], ['call', 'raise', 'fold'], 10, 30, 20, 100, 10, budget=0.02, seed=1)
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertIn(action, ['call', 'raise', 'fold'])
+
+    def test_overrun_keeps_worker_slot(self):
+        ''' Test a decision that overruns falls back, but its worker slot stays taken until the worker has finished '''
+        async def run():
+            pool = BotPool(max_workers=1, budget=0.01)
+            pool.shutdown()
+            pool.executor = ThreadPoolExecutor(1)
+            submit = pool.executor.submit
+            pool.executor.submit = lambda func, *args: submit(time.sleep, 0.3)     # A worker stuck well past the budget
+            try:
+                move = await pool.decide(['A♠', 'A♥'], [], ['check', 'bet'], 0, 20, 0, 100, 10)
+                held = pool.slots.locked()
+                await asyncio.sleep(0.4)
+                return move, held, pool.slots.locked()
+            finally:
+                pool.executor.shutdown()
+
+        self.assertEqual(asyncio.run(run()), (('check', 0), True, False))
+
+    def test_preflop_decisions_use_equity_table(self):
+        ''' Test bots read preflop equity from the equity table instead of sending the decision to a worker '''
+        async def run(table):
+            pool = BotPool(max_workers=1, budget=0.01, equity_table=table)
+            pool.shutdown()
+            pool.executor = ThreadPoolExecutor(1)
+            submitted = []
+            submit = pool.executor.submit
+            pool.executor.submit = lambda func, *args: submitted.append(func) or submit(lambda: ('call', 0))
+            try:
+                preflop = await pool.decide(['A♠', 'A♥'], [], ['call', 'raise', 'fold'], 10, 30, 20, 100, 10)
+                not_in_table = await pool.decide(['J♠', 'T♥'], [], ['call', 'raise', 'fold'], 10, 30, 20, 100, 10)
+                flop = await pool.decide(['A♠', 'A♥'], ['2♣', '7♦', '9♥'], ['call', 'raise', 'fold'], 10, 30, 20, 100, 10)
+                return preflop, not_in_table, flop, len(submitted)
+            finally:
+                pool.executor.shutdown()
+
+        with tempfile.TemporaryDirectory() as directory:
+            table = EquityTable(build_table(os.path.join(directory, 'equity.bin'), trials=200, classes=['AA', 'KQs', '72o'], workers=1))
+            try:
+                self.assertEqual(asyncio.run(run(table)), (('raise', 40), ('call', 0), ('call', 0), 2))
+            finally:
+                table.close()
+        self.assertTrue(parse_args(['-p', '1', '-e', 'preflop_equity.bin']).current_hand)     # -e turns on -c
+        self.assertFalse(parse_args(['-p', '1']).current_hand)
+
+    def test_restored_bots_without_bot_pool(self):
+        ''' Test a bot restored from a checkpoint on a server started without bots still plays, then leaves after the hand '''
+        async def run():
+            game = TCPokerServer()
+            adam, bot = Player("adam", None), BotPlayer("Bot 2")
+            game.players = [adam, bot]
+            game.game_active = True
+            game.current_player = bot
+            await game.bot_turn(bot, {"valid_actions": ['check', 'bet'], "to_call": 0, "pot": 20, "current_bet": 0})
+            move = bot.last_action
+            game.cleanup()
+            adam.ready = True
+            await game.check_all_ready()
+            return move, [p.name for p in game.players]
+
+        self.assertEqual(asyncio.run(run()), ('check', ["adam"]))
+
+    def test_bot_names_are_reserved(self):
+        ''' Test people can't join with a bot's name '''
+        async def run():
+            game = TCPokerServer()
+            reader, writer, task = memory_connection(game.handle_client, ('1.1.1.1', 0))
+            writer.write(b'{"username": "bot 2"}\n')
+            await task
+            return json.loads(await reader.readline()), game.players
+
+        reply, players = asyncio.run(run())
+        self.assertIn("kept for bots", reply["broadcast"])
+        self.assertEqual(players, [])
+
+
+class TestDeck(unittest.TestCase):
+    def test_seeded_deals(self):
+        ''' Test seeded tables deal the same hands, with no card dealt twice across resets '''
+        tables = [PokerTable(seed=5), PokerTable(seed=5)]
+        deals = []
+        for table in tables:
+            table.players = [Player("adam", None), Player("betty", None)]
+            table.deal_hole_cards()
+            table.deal_board(5)
+            first = [player.hand for player in table.players] + [table.community_cards]
+            table.reset_hand()
+            table.deal_hole_cards()
+            deals.append((first, [player.hand for player in table.players]))
+        self.assertEqual(deals[0], deals[1])
+        first_hand = sum(deals[0][0], [])
+        self.assertEqual(len(set(first_hand)), 9)
+        self.assertEqual(len(tables[0].deck), 48)
+
+    def test_restored_deck(self):
+        ''' Test a deck restored part way through a hand only deals the remaining cards, and gets all 52 back on reset '''
+        deck = Deck(PokerTable().random, ['A♠', 'K♠', 'Q♠'])
+        self.assertEqual(sorted(deck.draw_many(3)), ['A♠', 'K♠', 'Q♠'])
+        deck.reset()
+        self.assertEqual(sorted(deck.draw_many(52)), sorted(CARDS))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_bulk_deals(self):
+        ''' Test bulk deals are reproducible and never repeat a card within a deal '''
+        deals = deal_batch(1000, 9, seed=1)
+        self.assertEqual(deals.shape, (1000, 9))
+        self.assertTrue((deals == deal_batch(1000, 9, seed=1)).all())
+        self.assertTrue(all(len(set(deal)) == 9 for deal in deals.tolist()))
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.game = TCPokerServer(seed=7)
+        self.game.players = [Player("adam", None), Player("betty", None)]
+        self.game.game_active = True
+        for player in self.game.players:
+            self.game.place_ante(player, 10)
+            player.ante_placed = True
+        self.game.deal_hole_cards()
+        self.game.start_betting_round()
+        self.game.apply_action(self.game.players[0], 'bet', 20)
+        self.game.turn = 1
+
+    def test_snapshot_and_restore(self):
+        ''' Test a table restored from a snapshot has the same state, with hand states rebuilt '''
+        state = snapshot(self.game)
+        restored = restore(TCPokerServer(), state)
+        self.assertEqual(snapshot(restored), state)
+        adam, betty = restored.players
+        self.assertIs(restored.last_bettor, adam)
+        self.assertEqual(restored.pot_committed, {adam: 20, betty: 0})
+        self.assertEqual(restored.get_valid_actions(betty), ['call', 'raise', 'fold'])
+        self.assertEqual(betty.hand_state.category, self.game.players[1].hand_state.category)
+
+    def test_only_changed_tables_are_written(self):
+        ''' Test the checkpointer skips tables that haven't changed since the last write '''
+        with tempfile.TemporaryDirectory() as directory:
+            checkpointer = Checkpointer(directory, [self.game])
+            self.assertEqual(checkpointer.write(), 1)
+            self.assertEqual(checkpointer.write(), 0)
+            self.game.apply_action(self.game.players[1], 'call')
+            self.assertEqual(checkpointer.write(), 1)
+            self.assertEqual(load(directory), [snapshot(self.game)])
+
+    def test_no_checkpoint_part_way_through_a_turn(self):
+        ''' Test a table isn't checkpointed between a betting action and the next turn, restoring it would replay the action '''
+        async def run(checkpointer):
+            betty = self.game.players[1]
+            self.game.current_player = betty
+            await self.game.handle_betting_action(betty, 'call', 0)
+            during = checkpointer.write()
+            self.game.turn += 1     # What betting_round does once the turn is over
+            self.game.acted = False
+            return during, checkpointer.write()
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpointer = Checkpointer(directory, [self.game])
+            self.assertEqual(asyncio.run(run(checkpointer)), (0, 1))
+            self.assertEqual(load(directory)[0]["turn"], 2)
+
+    def test_no_checkpoint_between_paying_and_resetting(self):
+        ''' Test a table isn't checkpointed while the winner is told, after the pot is paid and before the hand is reset,
+            restoring it would play the showdown again and pay the pot twice '''
+        adam, betty = self.game.players
+        betty.folded = True
+        during = []
+
+        async def send_message(player, message):
+            if "Congratulations" in message.get("broadcast", ""):
+                during.append((checkpointer.write(), adam.stack))
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpointer = Checkpointer(directory, [self.game])
+            self.game.send_message = send_message
+            asyncio.run(self.game.determine_winner())
+            self.assertEqual(during, [(0, 110)])
+            self.assertEqual(checkpointer.write(), 1)
+            state = load(directory)[0]
+            self.assertEqual((state["pot"], state["game_active"]), (0, False))
+            self.assertEqual([player[2] for player in state["players"]], [110, 90])
+
+    def test_seats_are_unique(self):
+        ''' Test a username already at the table is turned away, and a checkpoint with two seats of one name is refused '''
+        async def run():
+            game = TCPokerServer()
+            connections = [memory_connection(game.handle_client, (f"1.1.1.{i}", 0)) for i in range(2)]
+            for _, writer, _ in connections:
+                writer.write(b'{"username": "adam"}\n')
+            reader, writer, task = connections[1]
+            await task
+            reply = json.loads(await reader.readline())
+            seated = [player.name for player in game.players]
+            connections[0][1].close()
+            await connections[0][2]
+            return reply, seated
+
+        reply, seated = asyncio.run(run())
+        self.assertIn("already at the table", reply["broadcast"])
+        self.assertEqual(seated, ["adam"])
+        state = snapshot(self.game)
+        state["players"][1][0] = "adam"
+        with self.assertRaises(ValueError):
+            restore(TCPokerServer(), state)
+
+    def test_resume_after_restart(self):
+        ''' Test a hand checkpointed mid-flop is finished by a new server once both players reconnect '''
+        async def run():
+            game = TCPokerServer(seed=7)
+            game.solver = True
+            server = await asyncio.start_server(game.handle_client, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            flop = asyncio.Event()
+
+            async def play(name, port, until_flop):
+                client = HeadlessClient('127.0.0.1', port, name)
+                await client.connect()
+                if until_flop:
+                    await client.send_command('ready')
+                try:
+                    async for message in client.messages():
+                        action = message.get("action")
+                        if until_flop and len(client.community_cards) == 3:
+                            flop.set()
+                            return
+                        if action == "collect_ante":
+                            await client.send_command('ante', 10)
+                        elif action == "collect_bets":
+                            await client.send_command('call' if 'call' in client.valid_commands else 'check')
+                        elif message.get("game_state") == "lobby":
+                            return client.stack
+                finally:
+                    await client.close()
+
+            clients = [asyncio.create_task(play(name, port, True)) for name in ("adam", "betty")]
+            await asyncio.wait_for(flop.wait(), 5)
+            state = json.loads(json.dumps(snapshot(game)))
+            server.close()
+            await asyncio.gather(*clients)
+            game.cleanup()
+
+            # A new server, as if the process had restarted
+            restarted = restore(TCPokerServer(), state)
+            restarted.solver = True
+            seated = list(restarted.players)
+            server = await asyncio.start_server(restarted.handle_client, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                await asyncio.wait_for(asyncio.gather(*(play(name, port, False) for name in ("adam", "betty"))), 5)
+            finally:
+                restarted.cleanup()
+                server.close()
+            return state, seated
+
+        state, seated = asyncio.run(run())
+        self.assertEqual(state["street"], 1)
+        self.assertEqual(state["pot"], 20)
+        self.assertEqual([player.name for player in seated], ["adam", "betty"])
+        self.assertEqual(sum(player.stack for player in seated), 200)     # The pot went to the winner of the resumed hand
+
+
+class TestHarness(unittest.TestCase):
+    SCENARIO = {
+        "seed": 7, "players": ["adam", "betty"],
+        "hands": [{"adam": ["bet 20"], "betty": ["call"]}, {"betty": ["bet 10"], "adam": ["fold"]}],
+        "expect": {"stacks": {"adam": 60, "betty": 140}}
+    }
+
+    def test_scenarios(self):
+        ''' Test seeded multi-hand sessions play out the same way every time, with and without the solver '''
+        for solver in (False, True):
+            result = asyncio.run(run_scenario(dict(self.SCENARIO, solver=solver)))
+            self.assertEqual(result["failures"], [])
+            self.assertEqual(sum(1 for _, message in result["transcript"] if message.get("game_state") == "lobby"), 4)
+
+    def test_unmet_expectation(self):
+        ''' Test a scenario reports stacks that don't match its expectation '''
+        result = asyncio.run(run_scenario(dict(self.SCENARIO, expect={"stacks": {"adam": 100}})))
+        self.assertEqual(result["failures"], ["Expected adam to finish with 100, they have 60"])
+
+    def test_record_and_replay(self):
+        ''' Test a recorded session replays without divergences, and a different seed shows up as one '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.jsonl")
+            recorder = SessionRecorder(path, self.SCENARIO["seed"])
+            asyncio.run(run_scenario(self.SCENARIO, recorder=recorder))
+            recorder.close()
+            self.assertEqual(asyncio.run(replay(path)), [])
+
+            with open(path, encoding='utf-8') as f:
+                header, *events = f.readlines()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(dict(json.loads(header), seed=8)) + "\n")
+                f.writelines(events)
+            self.assertTrue(asyncio.run(replay(path, timeout=0.2)))
+
+    def test_replay_keeps_limits_and_bot_decisions(self):
+        ''' Test frames refused by the recorded rate limit, and bots deciding at random, replay without divergences '''
+        class CoinFlipBots:
+            async def decide(self, hole_cards, community_cards, valid_actions, *_):
+                return random.choice([action for action in valid_actions if action in ('check', 'call', 'fold')]), 0
+
+        self.now = 0.0
+        self.ticking = False
+
+        def clock():
+            ''' Stands still through the flood, then moves a second per reading so the game is never throttled '''
+            self.now += self.ticking
+            return self.now
+
+        async def run(path):
+            admission = AdmissionControl(rate=1, burst=3, clock=clock)
+            game = make_server(seed=7, admission=admission)
+            game.bots = CoinFlipBots()
+            game.recorder = SessionRecorder(path, 7, admission=admission, bots=True, clock=clock)
+            adam = ScriptedPlayer("adam", [[], []], [])
+            adam.reader, adam.writer, task = memory_connection(game.handle_client, ("memory-0", 0))
+            await adam.send_message({"username": "adam"})
+            for _ in range(6):
+                await adam.send_command('status')
+            await asyncio.sleep(0.05)
+            self.ticking = True
+            await adam.send_command('ready')
+            try:
+                await asyncio.wait_for(adam.receive_messages(), 5)
+            finally:
+                await adam.close()
+                game.cleanup()
+                await asyncio.gather(task, return_exceptions=True)
+                game.recorder.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.jsonl")
+            asyncio.run(run(path))
+            with open(path, encoding='utf-8') as f:
+                header, *events = [json.loads(line) for line in f]
+            self.assertEqual(header["admission"]["burst"], 3)
+            self.assertTrue(any(event["event"] == "bot" for event in events))
+            self.assertTrue(any("Rate limit exceeded" in (event["data"] or "") for event in events if event["event"] == "send"))
+            self.assertEqual(asyncio.run(replay(path)), [])
+
+
+class TestAdminChannel(unittest.TestCase):
+    def test_admin_commands(self):
+        ''' Test operators can authenticate, inspect, mute, pause, resume and kick over the admin channel '''
+        async def run():
+            game = TCPokerServer()
+            server = await asyncio.start_server(game.handle_client, '127.0.0.1', 0)
+            admin_server = await start_admin_server(AdminChannel([game], game.admission, "secret"), 0)
+            port = server.sockets[0].getsockname()[1]
+            admin_port = admin_server.sockets[0].getsockname()[1]
+            admin = lambda *command, token="secret": send_command('127.0.0.1', admin_port, list(command), token)
+            adam, betty = clients = [HeadlessClient('127.0.0.1', port, name) for name in ("adam", "betty")]
+            results = {}
+            try:
+                for client in clients:
+                    await client.connect()
+                messages = [client.messages() for client in clients]
+                while len(game.players) < 2:
+                    await asyncio.sleep(0.01)
+
+                results["bad token"] = await admin("tables", token="wrong")
+                results["tables"] = (await admin("tables"))["result"]
+                results["connections"] = (await admin("connections"))["result"]
+                await admin("mute", "adam")
+                await adam.send_command('ready')
+                async for message in messages[0]:
+                    if "error" in message:
+                        results["muted"] = message["error"]
+                        break
+                await admin("unmute", "adam")
+                await admin("pause")
+                for client in clients:
+                    await client.send_command('ready')
+                await asyncio.sleep(0.05)
+                results["started while paused"] = game.game_active
+                await admin("resume")
+                async for message in messages[1]:
+                    if message.get("action") == "collect_ante":
+                        break
+                results["started after resume"] = game.game_active
+                results["limits"] = (await admin("limits", "rate=2"))["result"]
+                results["dump"] = (await admin("dump"))["result"]
+                await admin("kick", "betty")
+                async for message in messages[1]:
+                    pass    # Ends when the server closes betty's connection
+                while len(game.players) > 1:
+                    await asyncio.sleep(0.01)
+                results["after kick"] = (await admin("tables"))["result"][0]["players"]
+            finally:
+                for client in clients:
+                    await client.close()
+                game.cleanup()
+                server.close()
+                admin_server.close()
+            return results
+
+        results = asyncio.run(asyncio.wait_for(run(), 10))
+        self.assertEqual(results["bad token"], {"error": "Invalid token."})
+        self.assertEqual(results["tables"][0]["players"], ["adam", "betty"])
+        self.assertEqual([c["name"] for c in results["connections"]], ["adam", "betty"])
+        self.assertEqual(results["muted"], "You have been muted by an admin.")
+        self.assertFalse(results["started while paused"])
+        self.assertTrue(results["started after resume"])
+        self.assertEqual(results["limits"]["rate"], 2.0)
+        self.assertEqual(results["dump"]["connected"], {"adam": True, "betty": True})
+        self.assertEqual(results["after kick"], ["adam"])
+
+    def test_ante_change_waits_for_next_hand(self):
+        ''' Test an ante changed mid-hand leaves the hand's minimum bet alone, and applies from the next hand '''
+        game = TCPokerServer()
+        adam = Player("adam", None)
+        game.players = [adam, Player("betty", None)]
+        game.game_active = True
+        admin = AdminChannel([game], game.admission)
+        asyncio.run(admin.process_command(['ante', '50']))
+        self.assertEqual(game.ante, 10)
+        self.assertEqual(game.apply_action(adam, 'bet', 20), 20)
+        self.assertEqual(snapshot(game)["next_ante"], 50)
+        game.cleanup()
+        self.assertEqual((game.ante, game.next_ante), (50, None))
+        asyncio.run(admin.process_command(['ante', '30']))      # Between hands it applies straight away
+        self.assertEqual(game.ante, 30)
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestHandLog(unittest.TestCase):
+    def play(self, log, table, hands, actions, winner, category):
+        ''' Records a hand without the network game flow '''
+        adam, betty = table.players
+        adam.hand, betty.hand = hands
+        record = HandRecord(table.table_id, ["adam", "betty"])
+        for player, action in zip(table.players, actions):
+            record.action(0, table.players.index(player), action)
+            table.place_ante(player, 10)
+        log.append(record, table, [table.players[winner]], category)
+        table.reset_hand()
+
+    def test_export_and_query(self):
+        ''' Test hands written in chunks are read back by the queries '''
+        table = PokerTable()
+        table.players = [Player("adam", None), Player("betty", None)]
+        with tempfile.TemporaryDirectory() as directory:
+            log = HandLog(directory, chunk_size=2)
+            self.play(log, table, (['A♠', 'A♥'], ['7♦', '2♣']), ('raise', 'fold'), 0, -1)
+            self.play(log, table, (['A♦', 'A♣'], ['K♠', 'Q♠']), ('call', 'call'), 1, 4)
+            self.play(log, table, (['9♠', '8♠'], ['J♦', 'J♣']), ('check', 'check'), 1, 1)
+            log.close()
+
+            self.assertEqual(sorted(name for name in os.listdir(directory) if name.startswith('chunk-')), ['chunk-000000', 'chunk-000001'])
+            self.assertEqual(np.load(os.path.join(directory, 'chunk-000000', 'hole_cards.npy')).shape, (2, 4))
+            self.assertEqual(vpip(directory), {"adam": (3, 2 / 3), "betty": (3, 1 / 3)})
+            win_rates = win_rate_by_class(directory)
+            self.assertEqual(win_rates["AA"], (2, 0.5))
+            self.assertEqual(win_rates["JJ"], (1, 1.0))
+            pots = pot_distribution(directory)
+            self.assertEqual(pots["hands"], 3)
+            self.assertEqual(pots["categories"]["Straight"], 1)
+            self.assertEqual(pots["categories"]["Uncontested"], 1)
+
+    def test_written_off_the_loop(self):
+        ''' Test hands are written from a thread, the open chunk is rewritten in place every interval rather than a new
+            chunk being started, and a full chunk is written straight away '''
+        table = PokerTable()
+        table.players = [Player("adam", None), Player("betty", None)]
+        hands = [((['A♠', 'A♥'], ['7♦', '2♣']), ('raise', 'fold'), 0, -1), ((['A♦', 'A♣'], ['K♠', 'Q♠']), ('call', 'call'), 1, 4),
+                 ((['9♠', '8♠'], ['J♦', 'J♣']), ('check', 'check'), 1, 1), ((['K♦', 'K♣'], ['3♠', '4♠']), ('call', 'call'), 0, 1)]
+        with tempfile.TemporaryDirectory() as directory:
+            log = HandLog(directory, chunk_size=3, interval=0.3)
+            written = lambda: (sorted(name for name in os.listdir(directory) if name.startswith('chunk-')),
+                               pot_distribution(directory)["hands"])
+            threads = []
+            save = log.save
+            log.save = lambda *args: threads.append(threading.current_thread()) or save(*args)
+
+            async def run():
+                writer = asyncio.create_task(log.run())
+                seen = []
+                for hand, wait in zip(hands, (0.5, 0.5, 0.1, 0.5)):
+                    self.play(log, table, *hand)
+                    if not seen:
+                        self.assertEqual(os.listdir(directory), [])     # Appending never writes on the loop
+                    await asyncio.sleep(wait)
+                    seen.append(written())
+                writer.cancel()
+                await asyncio.gather(writer, return_exceptions=True)
+                return seen
+
+            self.assertEqual(asyncio.run(run()), [(['chunk-000000'], 1), (['chunk-000000'], 2), (['chunk-000000'], 3),
+                                                  (['chunk-000000', 'chunk-000001'], 4)])
+            self.assertTrue(all(thread is not threading.main_thread() for thread in threads))
+            self.assertEqual(np.load(os.path.join(directory, 'chunk-000000', 'hole_cards.npy')).shape, (3, 4))
+            self.assertEqual(player_names(directory), ["adam", "betty"])
+
+
+class TestLoopWatchdog(unittest.TestCase):
+    def test_stall_attribution(self):
+        ''' Test a blocking call on the event loop is measured and attributed to its coroutine and table '''
+        class Table:
+            table_id = 3
+            async def slow_step(self):
+                time.sleep(0.2)
+
+        async def run():
+            watchdog = LoopWatchdog(interval=0.01, threshold=0.05)
+            heartbeat = asyncio.create_task(watchdog.run())
+            await asyncio.sleep(0.05)
+            await Table().slow_step()
+            await asyncio.sleep(0.05)
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            return watchdog.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats["stalls"], 1)
+        self.assertGreaterEqual(stats["lag_max"], 0.15)
+        stall = stats["recent"][0]
+        self.assertEqual(stall["table_id"], 3)
+        self.assertIn("slow_step", stall["coroutine"])
+        self.assertTrue(any("slow_step" in line for line in stall["stack"]))
+
+
 # suits = ['♠', '♥', '♦', '♣']
 # ranks = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
 if __name__ == '__main__':
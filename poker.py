@@ -0,0 +1,232 @@
+import random
+from deck import Deck
+from evaluator import HandState, evaluate_hand, get_best_hand
+
+
+
+class Player:
+    ''' Manages state of each player '''
+    def __init__(self, name, writer, stack=100):
+        self.name = name
+        self.writer = writer
+        self.ready = False
+        self.muted = False      # Commands from muted players are refused
+        self.stack = stack
+        self.hand = []
+        self.ante_placed = False
+        self.hand_placed = False
+        self.last_action = None
+        self.folded = False
+        self.total_bet = 0
+        self.hand_state = HandState()    # Incremental hand strength, updated as cards are dealt
+
+    def reset_hand(self):
+        ''' Clears everything about the player that only lasts for one hand '''
+        self.hand = []
+        self.ante_placed = False
+        self.hand_placed = False
+        self.last_action = None
+        self.folded = False
+        self.total_bet = 0
+        self.hand_state = HandState()
+
+
+
+class PokerTable:
+    ''' State and rules of a single poker table: the deck, betting rules, pot and hand evaluation.
+        Has no networking, asyncio or logging setup so worker processes, simulators and tests can import it cheaply.
+        TCPokerServer wraps it with the network game flow '''
+    def __init__(self, seed=None, table_id=0):
+        self.table_id = table_id
+        self.players = []
+        self.pot = 0
+        self.ante = 10
+        self.next_ante = None   # Ante changed during a hand, which only takes effect from the next one
+        self.random = random.Random(seed)
+        self.deck = self.create_deck()
+        self.community_cards = []
+        self.current_player = None
+        self.dealer_position = 0    # Who goes first during betting rounds
+        self.street = 0     # Betting round of the hand, 0 is preflop and 3 the river
+        self.turn = 0       # Turns taken in the current betting round, picks whose turn it is
+        self.acted = False  # Part way through a step: a betting action applied before the turn moves on, or the pot paid out before the hand is reset
+        self.current_bet = 0
+        self.pot_committed = {}     # How much each player has bet during each round
+        self.round_complete = False
+        self.last_bettor = None
+        self.best_hands = {}
+
+    def reset_hand(self):
+        ''' Clears the table for the next hand '''
+        for player in self.players:
+            player.reset_hand()
+        self.pot = 0
+        self.deck.reset()
+        self.community_cards = []
+        self.current_player = None
+        self.street = 0
+        self.turn = 0
+        self.acted = False
+        self.current_bet = 0
+        self.pot_committed = {}
+        self.round_complete = False
+        self.last_bettor = None
+        self.best_hands = {}
+        if self.next_ante is not None:
+            self.ante, self.next_ante = self.next_ante, None
+
+
+    def create_deck(self):
+        ''' Create the table's deck. It is shuffled as it's dealt, and reused for every hand '''
+        return Deck(self.random)
+
+    def deal_hole_cards(self):
+        ''' Deals two hole cards to each player '''
+        for player in self.players:
+            player.hand = [self.deck.draw(), self.deck.draw()]
+            player.hand_state = HandState(player.hand)
+
+    def deal_board(self, num_cards):
+        ''' Deals num_cards cards from the deck onto the community cards, and returns them '''
+        dealt = self.deck.draw_many(num_cards)
+        self.community_cards.extend(dealt)
+        for player in self.players:
+            player.hand_state.add(*dealt)
+        return dealt
+
+
+    def start_betting_round(self):
+        ''' Resets the per-round betting state '''
+        self.current_bet = 0
+        self.pot_committed = {player: 0 for player in self.players}
+        self.round_complete = False
+        self.turn = 0
+        self.acted = False
+        for p in self.players:
+            p.last_action = None
+        self.last_bettor = None
+
+    def should_end_round(self, current_player):
+        ''' Determine if betting round should end
+            A round should end if:
+            1. All players but one have folded
+            2. All players check, no one bets
+            3. If betting action occurs, all active players must bet and their bet amounts must be equal.
+        '''
+        active_players = [p for p in self.players if not p.folded]
+
+        # End round if all players but one have folded
+        if len(active_players) == 1:
+            return True
+
+        # End round if no bets have been made and all players have checked
+        if self.current_bet == 0 and all(p.last_action == 'check' for p in active_players):
+            return True
+
+        # If there's been betting action
+        if self.last_bettor:
+            # Check we've gone back to the last bettor and all players have matched
+            is_last_bettor = current_player == self.last_bettor
+            all_bets_matched = all(self.pot_committed[p] == self.current_bet for p in active_players)
+            return is_last_bettor and all_bets_matched
+
+        return False
+
+    def get_valid_actions(self, player):
+        ''' Determine valid actions for player '''
+        if player.folded:
+            return []
+
+        to_call = self.current_bet - self.pot_committed[player]
+
+        if self.current_bet == 0:
+            return ['check', 'bet']
+        elif to_call > player.stack:
+                return ['fold']
+        elif player.stack >= to_call * 2: # must have enough to raise
+            return ['call', 'raise', 'fold']
+        else:
+            return ['call', 'fold']
+
+
+    def place_ante(self, player, amount):
+        ''' Moves an ante from the player's stack into the pot. Returns False if they can't afford it '''
+        if amount > player.stack:
+            return False
+        self.pot += amount
+        player.stack -= amount
+        player.total_bet += amount
+        return True
+
+    def apply_action(self, player, action, amount=0):
+        ''' Applies a betting action. Returns how much the player put into the pot,
+            or None if the action isn't allowed and nothing changed '''
+        if action == 'check' and self.current_bet == 0:
+            player.last_action = 'check'
+            return 0
+        elif action == 'bet' and self.current_bet == 0:
+            if amount >= self.ante and amount <= player.stack:
+                self.current_bet = amount
+                self.commit(player, amount, amount)
+                player.last_action = 'bet'
+                self.last_bettor = player
+                return amount
+        elif action == 'call' and self.current_bet > 0:
+            to_call = self.current_bet - self.pot_committed[player]
+            if to_call <= player.stack:
+                self.commit(player, to_call, self.current_bet)
+                player.last_action = 'call'
+                return to_call
+        elif action == 'raise':
+            if amount >= self.current_bet * 2 and amount <= player.stack:
+                to_add = amount - self.pot_committed[player]
+                self.current_bet = amount
+                self.commit(player, to_add, amount)
+                player.last_action = 'raise'
+                self.last_bettor = player
+                return to_add
+        elif action == 'fold':
+            player.folded = True
+            player.last_action = 'fold'
+            return 0
+        return None
+
+    def commit(self, player, amount, committed):
+        ''' Moves amount from the player's stack into the pot, leaving them with committed in this round '''
+        self.pot += amount
+        self.pot_committed[player] = committed
+        player.stack -= amount
+        player.total_bet += amount
+
+
+    def parse_hand(self, player, hand):
+        ''' Parses the hand command containing a clients best poker hand.
+            Raises ValueError unless it picks 5 different cards by position, such as c1 or h2 '''
+        cards = [str(card).lower() for card in hand[1:]]
+        selected_cards = []
+
+        if len(cards) != 5 or len(set(cards)) != 5:
+            raise ValueError("Pick 5 different cards for your hand.")
+        for card in cards:
+            source = {'c': self.community_cards, 'h': player.hand}.get(card[:1])
+            if source is None or not card[1:].isdigit() or not 1 <= int(card[1:]) <= len(source):
+                raise ValueError(f"There is no card {card}.")
+            selected_cards.append(source[int(card[1:]) - 1])
+
+        return selected_cards
+
+    def award_pot(self, winners):
+        ''' Splits the pot evenly between winners. Returns each winner's share '''
+        self.acted = True   # The stacks are paid but the pot and hand stay until reset_hand
+        share = self.pot / len(winners) if len(winners) > 1 else self.pot
+        for winner in winners:
+            winner.stack += share
+        return share
+
+    def evaluate_hand(self, hand):
+        ''' Evaluates a hand and returns its rank and relevant cards for tie-breaking '''
+        return evaluate_hand(hand)
+
+    def get_best_hand(self, cards):
+        ''' Algorithmically determines the best 5-card poker hand from players 2 hand cards + 5 community cards '''
+        return get_best_hand(cards)
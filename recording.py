@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+RECORDING_VERSION = 2
+FLUSH_INTERVAL = 1.0    # Seconds recorded events are buffered before being written
+
+
+
+class SessionRecorder:
+    ''' Records every frame the server reads from and writes to its clients, in order, to a JSON lines file that
+        harness.replay() can play back against a fresh server. The first line holds the seed, options and admission limits
+        the server ran with, each following line is one event: {"t": seconds since the start, "conn": connection number,
+        "event": "open", "recv", "send", "close" or "bot", "data": the frame, the peer address for "open", or a bot's
+        [name, action, amount] decision}. Events are buffered and written from a thread by run(), close() writes the rest '''
+    def __init__(self, path, seed, solver=False, current_hand=False, admission=None, equity_table=None, bots=False,
+                 clock=time.monotonic, interval=FLUSH_INTERVAL):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.clock = clock
+        self.interval = interval
+        self.start = clock()
+        self.ids = itertools.count()
+        self.events = []    # Encoded lines waiting to be written
+        self.writer = ThreadPoolExecutor(max_workers=1)  # One thread, so batches are written in the order they were taken
+        limits = None
+        if admission:
+            limits = {"max_connections": admission.max_connections, "max_per_ip": admission.max_per_ip,
+                      "rate": admission.rate, "burst": admission.burst, "max_frame": admission.max_frame}
+        self.file.write(json.dumps({"version": RECORDING_VERSION, "seed": seed, "solver": solver, "current_hand": current_hand,
+                                    "admission": limits, "equity_table": equity_table, "bots": bots}) + "\n")
+        self.file.flush()
+
+    def record(self, conn, event, data=None):
+        self.events.append(json.dumps({"t": round(self.clock() - self.start, 6), "conn": conn, "event": event, "data": data}, ensure_ascii=False) + "\n")
+
+    def wrap(self, reader, writer):
+        ''' Wraps a connection's reader and writer so everything passing through them is recorded '''
+        conn = next(self.ids)
+        self.record(conn, "open", writer.get_extra_info('peername'))
+        return RecordingReader(self, conn, reader), RecordingWriter(self, conn, writer)
+
+    def save(self, events):
+        ''' Writes encoded events. Blocking, run() calls it in the writer thread '''
+        self.file.write(''.join(events))
+        self.file.flush()
+
+    async def run(self):
+        ''' Writes the buffered events off the event loop every interval seconds until cancelled '''
+        while True:
+            await asyncio.sleep(self.interval)
+            events, self.events = self.events, []
+            if events:
+                try:
+                    await asyncio.get_running_loop().run_in_executor(self.writer, self.save, events)
+                except OSError as e:
+                    logging.error(f"Failed to write session recording: {e}")
+
+    def close(self):
+        ''' Writes the rest after any batch still being written, then closes the file '''
+        events, self.events = self.events, []
+        self.writer.submit(self.save, events)
+        self.writer.shutdown(wait=True)
+        self.file.close()
+
+
+
+class RecordingReader:
+    def __init__(self, recorder, conn, reader):
+        self.recorder = recorder
+        self.conn = conn
+        self.reader = reader
+
+    async def readline(self):
+        data = await self.reader.readline()
+        if data:
+            self.recorder.record(self.conn, "recv", data.decode(errors='replace'))
+        else:
+            self.recorder.record(self.conn, "close")
+        return data
+
+
+
+class RecordingWriter:
+    def __init__(self, recorder, conn, writer):
+        self.recorder = recorder
+        self.conn = conn
+        self.writer = writer
+
+    def write(self, data):
+        for line in data.decode(errors='replace').splitlines(keepends=True):
+            self.recorder.record(self.conn, "send", line)
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+    async def wait_closed(self):
+        await self.writer.wait_closed()
+
+    def get_extra_info(self, name, default=None):
+        return self.writer.get_extra_info(name, default)
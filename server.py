@@ -3,81 +3,64 @@ import json
 import logging
 import argparse
 import random
-from itertools import combinations
-from collections import Counter
-
-logging.basicConfig(
-    # Configure logging
-    filename='server.log',
-    level=logging.INFO, 
-    format='%(asctime)s - %(levelname)s - %(message)s'
-    )
-
-
-
-class Player:
-    ''' Manages state of each player '''
-    def __init__(self, name, writer, stack=100):
-        self.name = name
-        self.writer = writer
-        self.ready = False
-        self.stack = stack  
-        self.hand = []
-        self.ante_placed = False
-        self.hand_placed = False
-        self.last_action = None
-        self.folded = False
-        self.total_bet = 0
-
-
-
-class TCPokerServer:
-    ''' Manages state of the Poker Game '''
-    def __init__(self, seed=None):
+import signal
+import time
+from poker import Player, PokerTable
+from evaluator import HAND_RANKINGS
+from bots import BotPlayer, BotPool, BOT_PREFIX, BOT_WORKERS, DECISION_BUDGET, fallback, is_bot_name
+from workers import WorkerPool, LATENCY_BUDGET
+from equity import EquityTable
+from admission import (AdmissionControl, FrameError, check_frame, MAX_FRAME_SIZE, MAX_CONNECTIONS,
+                       MAX_CONNECTIONS_PER_IP, COMMAND_RATE, COMMAND_BURST)
+from transport import start_frame_server, use_uvloop
+from admin import AdminChannel, ADMIN_HOST, start_admin_server
+from analytics import HandLog, HandRecord, CHUNK_SIZE, FLUSH_INTERVAL
+from recording import SessionRecorder
+from watchdog import LoopWatchdog, LAG_THRESHOLD
+from checkpoint import Checkpointer, CHECKPOINT_INTERVAL, RECONNECT_TIMEOUT
+import checkpoint
+
+
+# Community cards dealt before each betting round, and how the round is announced
+BETTING_ROUNDS = [(0, "first"), (3, "second"), (1, "third"), (1, "final")]
+
+
+
+class TCPokerServer(PokerTable):
+    ''' Manages state of the Poker Game. Runs the game flow for a PokerTable over the network '''
+    def __init__(self, seed=None, admission=None, workers=None):
+        super().__init__(seed)
         self.game_active = False
-        self.players = []
-        self.pot = 0
-        self.ante = 10
-        self.random = random.Random(seed)
-        self.deck = self.create_deck()
-        self.community_cards = []
         self.game_task = None
-        self.current_player = None
-        self.dealer_position = 0    # Who goes first during betting rounds
-        self.current_bet = 0
-        self.pot_committed = {}     # How much each player has bet during each round
-        self.round_complete = False
-        self.last_bettor = None
-        self.best_hands = {}
         self.ante_event = asyncio.Event()   # Signals when all antes are collected
         self.current_player_event = asyncio.Event()     # Signals when current players turn is over
         self.betting_round_event = asyncio.Event()  # Signals when the betting round is complete
         self.best_hands_event = asyncio.Event()     # Signals when both players have sent in their best hands
+        self.running = asyncio.Event()      # Cleared while an admin has paused the table
+        self.running.set()
+        self.connections = {}   # Open connections by writer: their address, player name and when they connected
+        self.recorder = None    # recording.SessionRecorder capturing every frame for replay, off when None
         self.solver = False     # Enables automatic hand solver
+        self.show_current_hand = False      # Send players their current best hand along with their hole cards
+        self.equity_table = None    # Precomputed preflop equities (equity.EquityTable), added to the current hand preflop
+        self.admission = admission or AdmissionControl()    # Connection caps, rate limits and frame size limit
+        self.workers = workers or WorkerPool()      # Where hand evaluation runs, inline on the event loop by default
+        self.bots = None    # BotPool deciding for bots that fill empty seats, bots are off when None
+        self.bot_tasks = set()      # Bot moves that are still being decided
+        self.hand_log = None    # analytics.HandLog that finished hands are recorded to, off when None
+        self.hand_record = None     # The hand in progress, while the hand log is on
 
     def cleanup(self):
         ''' Cleans up server state if a game in-progress is cancelled '''
         logging.info("Cleaning up game state...")
         self.game_active = False
-        for player in self.players:
-            player.hand = []
-            player.ante_placed = False
-            player.hand_placed = False
-            player.last_action = None
-            player.folded = False
-            player.total_bet = 0
         if self.game_task:
             self.game_task.cancel()
             self.game_task = None
-        self.pot = 0
-        self.deck = self.create_deck()
-        self.community_cards = []
-        self.current_player = None
-        self.current_bet = 0
-        self.pot_committed = {}
-        self.round_complete = False
-        self.last_bettor = None
-        self.best_hands = {}
+        for task in self.bot_tasks:
+            task.cancel()
+        self.hand_record = None
+        self.reset_hand()
         self.ante_event.clear()
         self.current_player_event.clear()
         self.betting_round_event.clear()
@@ -96,45 +79,77 @@ class TCPokerServer:
             self.best_hands_event.clear()
 
 
-    def create_deck(self):
-        ''' Create and shuffle a deck '''
-        suits = ['♠', '♥', '♦', '♣']
-        ranks = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
-        deck = [f"{rank}{suit}" for suit in suits for rank in ranks]
-        self.random.shuffle(deck)
-        return deck
-
-
     async def handle_client(self, reader, writer):
         ''' Main client event handler. Each time a client connects, this couroutine is started '''
+        if self.recorder:
+            reader, writer = self.recorder.wrap(reader, writer)
         addr = writer.get_extra_info('peername')
+        ip = addr[0] if addr else None
         print(f"Accepted new connection from {addr}")
         logging.info(f"Accepted new connection from {addr}")
 
+        # Turn away connections over the total or per-IP cap before reading anything from them
+        if not self.admission.admit(ip):
+            logging.info(f"Denied connection from {addr}, connection limit reached.")
+            writer.write((json.dumps({"error": "Server is full, try again later."}) + "\n").encode())
+            writer.close()
+            await writer.wait_closed()
+            return
+
+        self.connections[writer] = {"address": addr, "name": None, "since": time.monotonic()}
+        player = None
         # First thing clients do is join by sending their custom username, receive it here
         try:
-            data = await reader.readline()      # Respects the '\n' delimiter used by client.py
-            message = json.loads(data.decode())
+            message, error = await self.read_frame(reader, ip)
+            if error:
+                raise FrameError(error)     # No second chances before the client has joined
+            if message is None:
+                return
             if "username" not in message:       # Verify first message received from client is "username"
                 raise ValueError("Client username not found.")
-            player = Player(message["username"], writer)        # Create new Player for connected client
-            if len(self.players) >= 2:
-                await self.send_message(player, {"broadcast": f"There are already two players, denied connection."})
-                logging.info(f"Denied connection from {addr}, there are already the max number of connections available.")
-                await self.send_message(player, {"action": "clear_prompt"})
-                return
-            self.players.append(player)
-            logging.info(f"{addr} has chosen the username: {player.name}")
-            await self.broadcast({"broadcast": f"{player.name} has joined the game."})      
+            player = self.restored_seat(message["username"])
+            if player:
+                # Reconnecting to a seat restored from a checkpoint, the player keeps their stack and cards
+                player.writer = writer
+                logging.info(f"{addr} has reconnected as {player.name}")
+                await self.broadcast({"broadcast": f"{player.name} has rejoined the game."})
+                await self.resume_game()
+            else:
+                player = Player(message["username"], writer)        # Create new Player for connected client
+                if self.find_player(player.name):
+                    # Seats, checkpoints and rate limits all go by username
+                    await self.send_message(player, {"broadcast": f"{player.name} is already at the table, pick another username."})
+                    await self.send_message(player, {"action": "clear_prompt"})
+                    return
+                if is_bot_name(player.name):
+                    await self.send_message(player, {"broadcast": f"Usernames starting with '{BOT_PREFIX.strip()}' are kept for bots, pick another."})
+                    await self.send_message(player, {"action": "clear_prompt"})
+                    return
+                if len(self.players) >= 2 and not self.game_active:
+                    await self.unseat_bot()     # Humans take seats from bots between hands
+                if len(self.players) >= 2:
+                    await self.send_message(player, {"broadcast": f"There are already two players, denied connection."})
+                    logging.info(f"Denied connection from {addr}, there are already the max number of connections available.")
+                    await self.send_message(player, {"action": "clear_prompt"})
+                    return
+                self.players.append(player)
+                logging.info(f"{addr} has chosen the username: {player.name}")
+                await self.broadcast({"broadcast": f"{player.name} has joined the game."})      
+            self.connections[writer]["name"] = player.name
 
             # After client has joined the game, sit and wait for client to send commands
             while True:
-                data = await reader.readline()
-                if not data:
+                message, error = await self.read_frame(reader, ip, player.name)
+                if error:
+                    await self.send_message(player, {"error": error})
+                    continue
+                if message is None:
                     break
-                message = json.loads(data.decode())
                 logging.info(f"Received message from {player.name}: {message}")
                 await self.process_message(player, message)     # Process any received messages
+        except FrameError as e:
+            logging.warning(f"Dropping connection from {addr}: {e}")
+            writer.write((json.dumps({"error": str(e)}) + "\n").encode())
         except json.JSONDecodeError:
             logging.error("Invalid JSON received from client.")
         except Exception as e:
@@ -143,29 +158,134 @@ class TCPokerServer:
             # Cleanup after 'exit' command or unexpected client disconnect
             print(f"Connection closed for {addr}")
             logging.info(f"Connection closed for {addr}")
-            self.players.remove(player)
-            await self.broadcast({"broadcast": f"{player.name} has left the game."})
-            # When a client disconnects while a game is in progress, cancel the game and return the other client to lobby. 
-            # TODO: implement saving of player state, so players who disconnect can rejoin using their username
-            if(self.game_active):   
-                print("Ending current game...")
-                await self.broadcast({"broadcast": "Ending current game..."})
-                await self.broadcast({"game_state": "lobby"})
-                # Refund any bets made by the still-connected client
-                for client in self.players:
-                    if client != player:
-                        client.stack += client.total_bet
-                self.cleanup()
+            self.admission.release(ip)
+            self.connections.pop(writer, None)
+            if player in self.players:
+                await self.remove_player(player)
     
             writer.close()
             await writer.wait_closed()
 
 
+    async def remove_player(self, player):
+        ''' Takes a player who left off the table '''
+        self.players.remove(player)
+        self.admission.forget_player(player.name)
+        await self.broadcast({"broadcast": f"{player.name} has left the game."})
+        # When a client disconnects while a game is in progress, cancel the game and return the other client to lobby. 
+        if(self.game_active):   
+            print("Ending current game...")
+            await self.broadcast({"broadcast": "Ending current game..."})
+            await self.broadcast({"game_state": "lobby"})
+            # Refund any bets made by the still-connected client
+            for client in self.players:
+                if client != player:
+                    client.stack += client.total_bet
+            self.cleanup()
+        # Bots don't play on their own
+        if all(isinstance(p, BotPlayer) for p in self.players):
+            while self.players:
+                await self.unseat_bot()
+
+
+    def find_player(self, name):
+        for player in self.players:
+            if player.name == name:
+                return player
+        return None
+
+    async def kick(self, player):
+        ''' Disconnects a player, who leaves the table as if they had quit '''
+        await self.broadcast({"broadcast": f"{player.name} has been removed by an admin."})
+        logging.info(f"{player.name} has been kicked.")
+        if player.writer:
+            player.writer.close()   # handle_client sees the connection close and takes them off the table
+        else:
+            await self.remove_player(player)
+
+    async def pause(self):
+        ''' Holds the game before its next prompt. Game commands are refused until resume(), lobby commands still work '''
+        self.running.clear()
+        logging.info(f"Table {self.table_id} paused.")
+        await self.broadcast({"broadcast": "The table has been paused by an admin."})
+
+    async def resume(self):
+        self.running.set()
+        logging.info(f"Table {self.table_id} resumed.")
+        await self.broadcast({"broadcast": "The table has been resumed."})
+        if not self.game_active and any(p.ready for p in self.players if not isinstance(p, BotPlayer)):
+            await self.check_all_ready()
+
+
+    def restored_seat(self, name):
+        ''' The seat restored from a checkpoint that is waiting for name to reconnect, if there is one '''
+        for player in self.players:
+            if player.name == name and player.writer is None and not isinstance(player, BotPlayer):
+                return player
+        return None
+
+    async def resume_game(self):
+        ''' Carries on a hand restored from a checkpoint, once every restored player has reconnected '''
+        if self.game_task or not self.game_active:
+            return
+        if any(self.restored_seat(player.name) for player in self.players):
+            return
+        await self.broadcast({"start_game": True})
+        self.game_task = asyncio.create_task(self.start_game(resume=True))
+
+    async def drop_restored_seats(self, timeout=RECONNECT_TIMEOUT):
+        ''' Gives restored players timeout seconds to reconnect, then frees the seats of those who didn't '''
+        await asyncio.sleep(timeout)
+        for player in list(self.players):
+            if player in self.players and self.restored_seat(player.name):
+                logging.info(f"{player.name} did not reconnect, freeing their seat.")
+                await self.remove_player(player)
+
+
+    async def read_frame(self, reader, ip, name=None):
+        ''' Reads one '\n' delimited frame from a client and decodes it. Returns (message, error).
+            Every frame is charged against the client's rate limit, then frames that fail the cheap checks in check_frame are
+            rejected before json.loads. Only the first frame over the rate limit is answered with an error, the rest of the
+            throttle window is dropped without a reply, so a flood isn't turned into outbound traffic.
+            message is None once the client has disconnected. Raises FrameError if the frame is larger than the read limit '''
+        while True:
+            try:
+                data = await reader.readline()      # Respects the '\n' delimiter used by client.py
+            except ValueError:
+                # The StreamReader limit was hit before a '\n' arrived, the rest of the stream can't be trusted
+                raise FrameError("Message too large.")
+            if not data:
+                return None, None
+            if not self.admission.allow_command(ip, name):
+                if not self.admission.reject_command(ip, name):
+                    continue    # Already told, drop it silently
+                error = "Rate limit exceeded, slow down."
+            else:
+                dropped = self.admission.end_throttle(ip, name)
+                if dropped > 1:
+                    logging.warning(f"Dropped {dropped - 1} more messages from {name or ip} over the rate limit.")
+                error = check_frame(data, self.admission.max_frame)
+                if error is None:
+                    try:
+                        return json.loads(data), None
+                    except json.JSONDecodeError:
+                        error = "Invalid JSON."
+            logging.warning(f"Rejected message from {name or ip}: {error}")
+            return None, error
+
+
     async def process_message(self, player, message):
         ''' Processes any commands received after username stage. The list of commands a client is allowed to send is managed by the client'''
         if "command" in message:
             command = message["command"][0]
 
+            if player.muted and command != "exit":
+                await self.send_message(player, {"error": "You have been muted by an admin."})
+                return
+            if not self.running.is_set() and not isinstance(player, BotPlayer) and command in ['ante', 'check', 'bet', 'call', 'raise', 'fold', 'hand']:
+                await self.send_message(player, {"error": "The table is paused, wait for an admin to resume it."})
+                return
+
             if command == "ready":
                 if player.ready:
                     await self.send_message(player, {"broadcast": "You are already ready, use 'status' to view everyones ready status."})
@@ -186,16 +306,14 @@ class TCPokerServer:
             elif command.startswith("ante"):    # Usage: ante <amount>
                 amount = int(message["command"][1]) if len(message["command"]) > 1 else 0
                 
-                if amount <= player.stack:
-                    self.pot += amount
-                    player.stack -= amount
-                    player.total_bet += amount
+                if self.place_ante(player, amount):
+                    first_ante = not player.ante_placed
+                    player.ante_placed = True       # Along with the pot, so a checkpoint never sees one without the other
                     await self.broadcast({"broadcast": f"{player.name} bets ${amount}. Pot is now ${self.pot}."})
                     logging.info(f"{player.name} bets ${amount}. Pot: ${self.pot}")
                     await self.send_message(player, {"action": "clear_prompt"})
                     
-                    if not player.ante_placed:
-                        player.ante_placed = True
+                    if first_ante:
                         self.check_all_ante()
                         
                         if not self.ante_event.is_set():
@@ -215,7 +333,11 @@ class TCPokerServer:
                     await self.send_message(player, {"error": "Please wait your turn"})
             
             elif command == "hand":
-                poker_hand = self.parse_hand(player, message["command"])
+                try:
+                    poker_hand = self.parse_hand(player, message["command"])
+                except ValueError as e:
+                    await self.send_message(player, {"error": str(e)})
+                    return
                 self.best_hands[player] = poker_hand
                 player.hand_placed = True
                 await self.send_message(player, {"action":"clear_prompt"})
@@ -230,99 +352,171 @@ class TCPokerServer:
 
     async def check_all_ready(self):
         ''' Check if all clients are ready to start the game '''
+        if not self.running.is_set():
+            return      # resume() checks again
+        if self.bots:
+            await self.seat_bots()
+        elif not self.game_active:
+            # Bots restored from a checkpoint finish their hand, but don't stay on when bots are turned off
+            while any(isinstance(p, BotPlayer) for p in self.players):
+                await self.unseat_bot()
         if len(self.players) == 2 and all(p.ready for p in self.players):
             self.game_active = True
             await self.broadcast({"start_game": True})      # Notify clients that game has started
             self.game_task = asyncio.create_task(self.start_game())
 
 
-    async def start_game(self):
-        ''' Main Poker game flow'''
-        await self.broadcast({"broadcast": "All players are ready. Starting the game!"})
-        # 1. Collect the ante from both clients. Clients must post the ante to buy into the hand. 
+    async def seat_bots(self):
+        ''' Fills empty seats with bots, and readies up the bots already seated '''
+        while len(self.players) < 2:
+            bot = BotPlayer(f"{BOT_PREFIX}{len(self.players) + 1}")
+            self.players.append(bot)
+            logging.info(f"{bot.name} has taken an empty seat.")
+            await self.broadcast({"broadcast": f"{bot.name} has joined the game."})
         for player in self.players:
-            await self.send_message(player, {"stack": player.stack})
-        await self.broadcast({"action": "collect_ante", "amount": self.ante})
-        # 2. Wait for the antes to be collected
-        await self.ante_event.wait() 
-        # 3. Deal hole cards, and show them to the client (pre-flop)
-        await self.deal_hands()
-        # 4. Begin the first betting round 
-        await self.show_hands()
-        await self.broadcast({"broadcast": "Beginning first betting round..."})
-        await self.betting_round()
-        # 5. Wait for the first betting round to complete
-        await self.betting_round_event.wait()
-        # 6. Deal three community cards (Flop)
-        await self.broadcast({"broadcast": "Dealing community cards..."})
-        await self.deal_community_cards(3)
-        # 7. Begin the second betting round
-        await self.show_hands()
-        await self.broadcast({"broadcast": "Beginning second betting round..."})
-        await self.betting_round()
-        # 8. Wait for the second betting round to complete
-        await self.betting_round_event.wait()
-        # 9. Deal one community card (Turn)
-        await self.deal_community_cards(1)
-        # 10. Begin the third betting round
-        await self.show_hands()
-        await self.broadcast({"broadcast": "Beginning third betting round..."})
-        await self.betting_round()
-        # 11. Wait for the third betting round to complete
-        await self.betting_round_event.wait()
-        # 12. Deal final community card (River)
-        await self.deal_community_cards(1)
-        # 13. Begin the final betting round
-        await self.show_hands()
-        await self.broadcast({"broadcast": "Beginning final betting round..."})
-        await self.betting_round()
-        # 14. Wait for the final betting round to complete
-        await self.betting_round_event.wait()
-        # 15. Skip over comparing hands if all but one player has folded
+            if isinstance(player, BotPlayer):
+                player.ready = True
+
+
+    async def unseat_bot(self):
+        ''' Removes a bot from the table, if there is one '''
+        for player in self.players:
+            if isinstance(player, BotPlayer):
+                self.players.remove(player)
+                logging.info(f"{player.name} has left to make room.")
+                await self.broadcast({"broadcast": f"{player.name} has left the game."})
+                return
+
+
+    def notify_bot(self, bot, message):
+        ''' Bots receive the same messages as clients, and answer the ones that ask them to act '''
+        action = message.get("action")
+        if action == "collect_ante":
+            move = self.process_message(bot, {"command": ["ante", str(min(message["amount"], bot.stack))]})
+        elif action == "collect_bets":
+            move = self.bot_turn(bot, message)
+        elif action == "collect_hands":
+            community = {card: f"c{i + 1}" for i, card in enumerate(self.community_cards)}
+            hole = {card: f"h{i + 1}" for i, card in enumerate(bot.hand)}
+            move = self.process_message(bot, {"command": ["hand"] + [hole.get(card) or community[card] for card in bot.hand_state.best_hand]})
+        else:
+            return
+        # Run the move as its own task, the game flow that sent the message carries on meanwhile
+        task = asyncio.create_task(move)
+        self.bot_tasks.add(task)
+        task.add_done_callback(self.bot_tasks.discard)
+
+
+    async def bot_turn(self, bot, message):
+        ''' Decides a bot's betting action off the event loop, then plays it '''
+        if self.bots is None:
+            # A bot restored from a checkpoint, on a server started without bots
+            action, amount = fallback(message["valid_actions"])
+        else:
+            action, amount = await self.bots.decide(bot.hand, self.community_cards, message["valid_actions"], message["to_call"],
+                                                    message["pot"], message["current_bet"], bot.stack, self.ante)
+        if self.recorder:
+            self.recorder.record(None, "bot", [bot.name, action, amount])    # Replays play back the decision instead
+        if self.current_player is not bot:
+            return
+        if not await self.handle_betting_action(bot, action, amount):
+            await self.handle_betting_action(bot, 'fold', 0)
+        self.current_player_event.set()
+
+
+    async def start_game(self, resume=False):
+        ''' Main Poker game flow. With resume, carries on a hand restored from a checkpoint from the step it was at '''
+        if resume:
+            # The hand log only records hands it saw from the ante, the restored one is left out
+            await self.broadcast({"broadcast": "Resuming the hand..."})
+            if self.community_cards:
+                await self.broadcast({"community_cards": self.community_cards})
+        else:
+            await self.broadcast({"broadcast": "All players are ready. Starting the game!"})
+            if self.hand_log:
+                self.hand_record = HandRecord(self.table_id, [player.name for player in self.players])
+        resume_street = None    # Betting round that was in progress when the checkpoint was taken
+        if not all(player.hand for player in self.players):
+            await self.running.wait()
+            # 1. Collect the ante from both clients. Clients must post the ante to buy into the hand. 
+            for player in self.players:
+                await self.send_message(player, {"stack": player.stack})
+            for player in self.players:
+                if not player.ante_placed:
+                    await self.send_message(player, {"action": "collect_ante", "amount": self.ante})
+            # 2. Wait for the antes to be collected
+            self.check_all_ante()
+            await self.ante_event.wait() 
+            # 3. Deal hole cards, and show them to the client (pre-flop)
+            await self.deal_hands()
+        elif resume:
+            resume_street = self.street
+        # 4. Betting rounds, preflop then after the flop (three community cards), turn and river (one card each)
+        for street, (num_cards, name) in enumerate(BETTING_ROUNDS[self.street:], self.street):
+            if len(self.community_cards) < sum(cards for cards, _ in BETTING_ROUNDS[:street + 1]):
+                if street == 1:
+                    await self.broadcast({"broadcast": "Dealing community cards..."})
+                await self.deal_community_cards(num_cards)
+            await self.show_hands()
+            if street == resume_street:
+                await self.betting_round(resume=True)
+            else:
+                self.street = street
+                if self.hand_record:
+                    self.hand_record.street(street)
+                await self.broadcast({"broadcast": f"Beginning {name} betting round..."})
+                await self.betting_round()
+            # 5. Wait for the betting round to complete
+            await self.betting_round_event.wait()
+        # 6. Skip over comparing hands if all but one player has folded
         active_players = [p for p in self.players if not p.folded]
         if len(active_players) > 1:
-        # 16. If automatic solver is set, best hands will be determined automatically. Else clients must submit their own best hands
+        # 7. If automatic solver is set, best hands will be determined automatically. Else clients must submit their own best hands
             if self.solver:
+                # Every player's best hand is already known from their hand state, nothing left to evaluate
                 for player in self.players:
-                    best_hand = self.get_best_hand(player.hand + self.community_cards)
-                    self.best_hands[player] = best_hand
+                    self.best_hands[player] = player.hand_state.best_hand
                 self.best_hands_event.set() 
             else:
-                await self.broadcast({"action": "collect_hands"})
-        # 17. Wait for best hands to be received 
+                for player in self.players:
+                    if not player.hand_placed:
+                        await self.send_message(player, {"action": "collect_hands"})
+                self.check_all_hands()
+        # 8. Wait for best hands to be received 
             await self.best_hands_event.wait()
-        # 18. Determine who wins the pot based on who has the best poker hand
+        # 9. Determine who wins the pot based on who has the best poker hand
         await self.determine_winner()
 
 
     async def deal_hands(self):
         ''' Deals hole cards to each player '''
+        self.deal_hole_cards()
         for player in self.players:
-            player.hand = [self.deck.pop(), self.deck.pop()]
             logging.info(f"Dealt to {player.name}: {player.hand}")
 
     async def show_hands(self):
         ''' Sends each players hand and stack as a message for the client to display '''
         for player in self.players:
-            await self.send_message(player, {"hand": player.hand})
+            message = {"hand": player.hand}
+            if self.show_current_hand:
+                message["current_hand"] = player.hand_state.summary()
+                if self.equity_table and not self.community_cards:
+                    message["current_hand"]["equity"] = round(self.equity_table.equity(player.hand), 3)
+            await self.send_message(player, message)
             await self.send_message(player, {"stack": player.stack})
             
 
-    async def betting_round(self):
-        ''' Manages betting round '''
-        self.current_bet = 0
-        self.pot_committed = {player: 0 for player in self.players}
-        self.round_complete = False
+    async def betting_round(self, resume=False):
+        ''' Manages betting round. With resume, carries on a round restored from a checkpoint from the turn it was at '''
+        if not resume:
+            self.start_betting_round()
         self.betting_round_event.clear()
-        for p in self.players:
-            p.last_action = None
-        self.last_bettor = None
 
         while not self.round_complete:
-            for i in range(2):
-                if self.round_complete:
-                    break
-                await self.handle_player_turn(self.players[(i + self.dealer_position) % 2])   # Alternates between players each round
+            await self.handle_player_turn(self.players[(self.turn + self.dealer_position) % 2])   # Alternates between players each turn
+            self.turn += 1
+            self.acted = False
+        self.betting_round_event.set()
 
 
     async def handle_player_turn(self, player):
@@ -337,6 +531,7 @@ class TCPokerServer:
             self.betting_round_event.set()
             return
         
+        await self.running.wait()      # Hold the turn while the table is paused
         self.current_player = player
         self.current_player_event.clear()
 
@@ -361,134 +556,42 @@ class TCPokerServer:
         await self.current_player_event.wait()
 
     
-    def should_end_round(self, current_player):
-        ''' Determine if betting round should end 
-            A round should end if:
-            1. All players but one have folded
-            2. All players check, no one bets
-            3. If betting action occurs, all active players must bet and their bet amounts must be equal.
-        '''
-        active_players = [p for p in self.players if not p.folded]
-
-        # End round if all players but one have folded
-        if len(active_players) == 1:
-            return True
-        
-        # End round if no bets have been made and all players have checked
-        if self.current_bet == 0 and all(p.last_action == 'check' for p in active_players):
-            return True
-
-        # If there's been betting action
-        if self.last_bettor:
-            # Check we've gone back to the last bettor and all players have matched
-            is_last_bettor = current_player == self.last_bettor
-            all_bets_matched = all(self.pot_committed[p] == self.current_bet for p in active_players)
-            return is_last_bettor and all_bets_matched
-
-        return False
-    
-    
     async def deal_community_cards(self, num_cards):
-        ''' Pop num_cards cards from the deck and add to community cards
+        ''' Deal num_cards cards from the deck and add to community cards
             Display community cards to the clients '''
-        for _ in range(num_cards):
-            self.community_cards.append(self.deck.pop())
+        self.deal_board(num_cards)
         await self.broadcast({"community_cards": self.community_cards})
         logging.info(f"Dealt community cards: {self.community_cards}")
     
-    def get_valid_actions(self, player):
-        ''' Determine valid actions for player '''
-        if player.folded:
-            return []
-        
-        to_call = self.current_bet - self.pot_committed[player]
-
-        if self.current_bet == 0:
-            return ['check', 'bet']
-        elif to_call > player.stack:
-                return ['fold']
-        elif player.stack >= to_call * 2: # must have enough to raise
-            return ['call', 'raise', 'fold']
-        else:
-            return ['call', 'fold']
-            
-
     async def handle_betting_action(self, player, action, amount):
         ''' Handle betting round actions '''
-        if action == 'check' and self.current_bet == 0:
-            player.last_action = 'check'
-            await self.broadcast({"broadcast": f"{player.name} has checked. Pot: ${self.pot}"})
-            logging.info(f"{player.name} has checked. Pot: ${self.pot}")
-            await self.send_message(player, {"action":"clear_prompt"})
-            return True
-        elif action == 'bet' and self.current_bet == 0:
-            if amount >= self.ante and amount <= player.stack:
-                self.current_bet = amount
-                self.pot += amount
-                self.pot_committed[player] = amount
-                player.stack -= amount
-                player.total_bet += amount
-                player.last_action = 'bet'
-                self.last_bettor = player
-                await self.broadcast({"broadcast": f"{player.name} has bet ${amount}. Pot: ${self.pot}"})
-                logging.info(f"{player.name} has bet ${amount}. Pot: ${self.pot}")
-                await self.send_message(player, {"action":"clear_prompt"})
-                return True
-            else:
+        put_in = self.apply_action(player, action, amount)
+        if put_in is None:
+            if action == 'bet' and self.current_bet == 0:
                 await self.send_message(player, {"broadcast":"Invalid bet. Make sure you have enough money to bet."})
-        elif action == 'call' and self.current_bet > 0:
-            to_call = self.current_bet - self.pot_committed[player]
-            if to_call <= player.stack:
-                self.pot += to_call
-                self.pot_committed[player] = self.current_bet
-                player.stack -= to_call
-                player.total_bet += to_call
-                player.last_action = 'call'
-                await self.broadcast({"broadcast": f"{player.name} has called ${to_call}. Pot: ${self.pot}"})
-                logging.info(f"{player.name} has called ${to_call}. Pot: ${self.pot}")
-                await self.send_message(player, {"action":"clear_prompt"})
-                return True
-            else:
+            elif action == 'call' and self.current_bet > 0:
                 await self.send_message(player, {"broadcast":"Invalid call. Make sure you have enough money to call the current bet."})
-        elif action == 'raise':
-            if amount >= self.current_bet * 2 and amount <= player.stack:
-                to_add = amount - self.pot_committed[player]
-                self.pot += to_add
-                self.current_bet = amount
-                self.pot_committed[player] = amount
-                player.stack -= to_add
-                player.total_bet += to_add
-                player.last_action = 'raise'
-                self.last_bettor = player
-                await self.broadcast({"broadcast": f"{player.name} has raised to ${to_add}. Pot: ${self.pot}"})
-                logging.info(f"{player.name} has raised to ${to_add}. Pot: ${self.pot}")
-                await self.send_message(player, {"action":"clear_prompt"})
-                return True
-            else:
+            elif action == 'raise':
                 await self.send_message(player, {"broadcast":"Invalid raise. You must raise by atleast 2x the current bet. Make sure you have enough money to raise the bet."})
-        elif action == 'fold':
-            player.folded = True
-            player.last_action = 'fold'
-            await self.send_message(player, {"action":"clear_prompt"})
-            return True
-        
-        return False
-    
-    def parse_hand(self, player, hand):
-        ''' Parses the hand command containing a clients best poker hand'''
-        cards = hand[1:]
-        selected_cards = []
-
-        for card in cards:
-            card_type = card[0]
-            pos = int(card[1]) - 1
+            return False
+        self.acted = True   # Until betting_round moves on to the next turn
 
-            if card_type == 'c':
-                selected_cards.append(self.community_cards[pos])
-            else:
-                selected_cards.append(player.hand[pos])
-
-        return selected_cards
+        if self.hand_record:
+            self.hand_record.action(self.street, self.players.index(player), action)
+        if action == 'check':
+            await self.broadcast({"broadcast": f"{player.name} has checked. Pot: ${self.pot}"})
+            logging.info(f"{player.name} has checked. Pot: ${self.pot}")
+        elif action == 'bet':
+            await self.broadcast({"broadcast": f"{player.name} has bet ${put_in}. Pot: ${self.pot}"})
+            logging.info(f"{player.name} has bet ${put_in}. Pot: ${self.pot}")
+        elif action == 'call':
+            await self.broadcast({"broadcast": f"{player.name} has called ${put_in}. Pot: ${self.pot}"})
+            logging.info(f"{player.name} has called ${put_in}. Pot: ${self.pot}")
+        elif action == 'raise':
+            await self.broadcast({"broadcast": f"{player.name} has raised to ${put_in}. Pot: ${self.pot}"})
+            logging.info(f"{player.name} has raised to ${put_in}. Pot: ${self.pot}")
+        await self.send_message(player, {"action":"clear_prompt"})
+        return True
 
     async def broadcast(self, message):
         ''' Send a message to all players '''
@@ -498,6 +601,11 @@ class TCPokerServer:
 
     async def send_message(self, player, message):
         ''' Send a message to a specific player '''
+        if isinstance(player, BotPlayer):
+            self.notify_bot(player, message)
+            return
+        if player.writer is None:       # Restored from a checkpoint and not reconnected yet
+            return
         try:
             player.writer.write((json.dumps(message) + "\n").encode())      # All messages end with '\n' delimiter
             await player.writer.drain()
@@ -516,14 +624,17 @@ class TCPokerServer:
             winner_player = active_players[0]
             logging.info(f"{winner_player.name} has won the ${self.pot} pot as all other players have folded.")
             await self.broadcast({"broadcast":f"{winner_player.name} has won the ${self.pot} pot as all other players have folded."})
-            winner_player.stack += self.pot
-            await self.send_message(winner_player, {"broadcast":f"Congratulations on winning! You won ${self.pot}. You now have ${winner_player.stack} in your stack."})
+            winners, category = [winner_player], -1
+            winnings = self.award_pot(winners)
+            await self.send_message(winner_player, {"broadcast":f"Congratulations on winning! You won ${winnings}. You now have ${winner_player.stack} in your stack."})
         else:
-            evaluated_hands = {}
-
             for player in self.players:
                 logging.info(f"Evaluating {player.name}'s hand: {self.best_hands[player]}")
-                evaluated_hands[player] = self.evaluate_hand(self.best_hands[player])
+            if self.solver:
+                evaluated_hands = {player: player.hand_state.score for player in self.players}
+            else:
+                solved = await self.workers.solve([self.best_hands[player] for player in self.players])
+                evaluated_hands = {player: score for player, (_, score) in zip(self.players, solved)}
 
             # Sort players by their evaluated hand ranking and relevant cards for breaking ties
             sorted_players = sorted(evaluated_hands.items(), key=lambda x: x[1], reverse=True)
@@ -533,33 +644,31 @@ class TCPokerServer:
             loser_player, loser_hand_info = sorted_players[1]
 
             # Determine the name of the winning hand based on its ranking.
-            hand_rankings = [
-                "High Card", "One Pair", "Two Pair", "Three of a Kind", 
-                "Straight", "Flush", "Full House", "Four of a Kind", 
-                "Straight Flush", "Royal Flush"
-            ]
-
-            winning_hand_name = hand_rankings[winner_hand_info[0]]
-            losing_hand_name = hand_rankings[loser_hand_info[0]]
+            winning_hand_name = HAND_RANKINGS[winner_hand_info[0]]
+            losing_hand_name = HAND_RANKINGS[loser_hand_info[0]]
+            category = winner_hand_info[0]
 
             # Check for an exact tie
             if winner_hand_info == loser_hand_info:     # Same hand name and tie breaking cards
                 await self.broadcast({"broadcast": f"How rare! An exact tie! {winner_player.name} and {loser_player.name} split the pot of ${self.pot} with a {winning_hand_name}."})
                 await self.broadcast({"broadcast": f"{winner_player.name} had a {self.best_hands[winner_player]}, and {loser_player.name} had a {self.best_hands[loser_player]}."})
                 logging.info(f"The game ended in an exact tie. Both players had a {winning_hand_name}. ")
-                winner_player.stack += self.pot/2
-                loser_player.stack += self.pot/2
-                await self.send_message(winner_player, {"broadcast":f"Congratulations on winning! You won ${self.pot/2}. You now have ${winner_player.stack} in your stack."})
-                await self.send_message(loser_player, {"broadcast":f"Congratulations on winning! You won ${self.pot/2}. You now have ${loser_player.stack} in your stack."})
+                winners = [winner_player, loser_player]
+                winnings = self.award_pot(winners)
+                await self.send_message(winner_player, {"broadcast":f"Congratulations on winning! You won ${winnings}. You now have ${winner_player.stack} in your stack."})
+                await self.send_message(loser_player, {"broadcast":f"Congratulations on winning! You won ${winnings}. You now have ${loser_player.stack} in your stack."})
 
             else:
                 # Broadcast the winner 
                 await self.broadcast({"broadcast": f"{winner_player.name} has won ${self.pot} with a {winning_hand_name}!"})
                 await self.broadcast({"broadcast": f"{winner_player.name} has won the game with the hand: {winning_hand_name} - {self.best_hands[winner_player]}, beating {loser_player.name}'s hand: {losing_hand_name} - {self.best_hands[loser_player]}."})
                 logging.info(f"{winner_player.name} has won the game with the hand: {winning_hand_name} - {self.best_hands[winner_player]}, beating {loser_player.name}'s hand: {losing_hand_name} - {self.best_hands[loser_player]}.")
-                winner_player.stack += self.pot
-                await self.send_message(winner_player, {"broadcast":f"Congratulations on winning! You won ${self.pot}. You now have ${winner_player.stack} in your stack."})
+                winners = [winner_player]
+                winnings = self.award_pot(winners)
+                await self.send_message(winner_player, {"broadcast":f"Congratulations on winning! You won ${winnings}. You now have ${winner_player.stack} in your stack."})
 
+        if self.hand_record:
+            self.hand_log.append(self.hand_record, self, winners, category)
         await self.broadcast({"broadcast": "Ending current round, ready up to play another!"})
         await self.broadcast({"game_state": "lobby"})
         self.dealer_position += 1
@@ -568,92 +677,144 @@ class TCPokerServer:
         self.cleanup()
 
 
-    def evaluate_hand(self, hand):
-        ''' Evaluates a hand and returns its rank and relevant cards for tie-breaking '''
-        # Extract ranks and suits from hand
-        card_ranks = {str(n): n for n in range (2, 10)}
-        card_ranks.update({'T': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14})
-        ranks = sorted([card_ranks[card[:-1]] for card in hand], reverse=True)
-        suits = [card[-1] for card in hand]
-        
-        # Check for a flush 
-        is_flush = len(set(suits)) == 1
-
-        # Check for a straight
-        is_straight = ranks == list(range(ranks[0], ranks[0] - 5, -1))
-
-        # Check for an ace-low straight
-        if ranks == [14, 5, 4, 3, 2]:
-            is_straight = True
-            ranks = [5, 4, 3, 2, 1]
-
-        # Count occurrences of each rank
-        rank_counts = Counter(ranks).most_common()
-
-        # Determine hand type based on rank counts and other checks
-        if is_flush and is_straight:
-            return (9 if ranks[0] == 14 else 8, ranks)  # Royal flush or Straight flush
-        
-        elif rank_counts[0][1] == 4:
-            return (7, [rank_counts[0][0], rank_counts[1][0]])  # Four of a kind
-        
-        elif rank_counts[0][1] == 3 and rank_counts[1][1] == 2:
-            return (6, [rank_counts[0][0], rank_counts[1][0]])  # Full house
-        
-        elif is_flush:
-            return (5, ranks)   # Flush
-        
-        elif is_straight:
-            return (4, ranks)   # Straight
-        
-        elif rank_counts[0][1] == 3:
-            return (3, [rank_counts[0][0]] + sorted([rank for rank, count in rank_counts if count == 1], reverse=True))     # Three of a kind
-        
-        elif rank_counts[0][1] == 2 and rank_counts[1][1] == 2:
-            return (2, sorted([rank_counts[0][0], rank_counts[1][0]], reverse=True) + [rank_counts[2][0]])  # Two pair
-        
-        elif rank_counts[0][1] == 2:
-            return (1, [rank_counts[0][0]] + sorted([rank for rank, count in rank_counts if count == 1], reverse=True))     # One pair
-        
-        else: 
-            return (0, ranks)   # High card
-        
-
-    def get_best_hand(self, cards):
-        ''' Algorithmically determines the best 5-card poker hand from players 2 hand cards + 5 community cards '''
-        best_score = (-1, [])
-        best_hand = []
-
-        for hand in combinations(cards, 5):
-            score = self.evaluate_hand(hand)
-            if score > best_score:
-                best_score = score
-                best_hand = hand
-        return best_hand
-
-
-async def main():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="TCPoker Server")
     parser.add_argument('-p', '--port', type=int, required=True, help='Port to listen on.')
     parser.add_argument('-s', '--solve', action='store_true', required=False, help='Enable automatic hand solver.')
-    args = parser.parse_args() 
-    
-    poker_server = TCPokerServer()
+    parser.add_argument('--seed', type=int, default=None, help='Seed for shuffling, the same seed deals the same cards.')
+    parser.add_argument('--record', default=None, help='Record every frame sent and received to this file, for replay with harness.py.')
+    parser.add_argument('-c', '--current-hand', action='store_true', required=False, help='Show players their current best hand on every street.')
+    parser.add_argument('-e', '--equity-table', default=None, help='Preflop equity table built with equity.py, shown with the current hand (turns on -c) and used by bots preflop.')
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS, help='Maximum number of open connections.')
+    parser.add_argument('--max-per-ip', type=int, default=MAX_CONNECTIONS_PER_IP, help='Maximum number of open connections from a single IP.')
+    parser.add_argument('--rate', type=float, default=COMMAND_RATE, help='Commands per second each client may send.')
+    parser.add_argument('--burst', type=int, default=COMMAND_BURST, help='Commands each client may send back to back before being rate limited.')
+    parser.add_argument('--max-frame', type=int, default=MAX_FRAME_SIZE, help='Largest message (in bytes) accepted from a client.')
+    parser.add_argument('-t', '--transport', choices=['streams', 'protocol'], default='streams', help='Connection handling, asyncio streams or the lower overhead FrameProtocol.')
+    parser.add_argument('--uvloop', action='store_true', help='Use the uvloop event loop if it is installed.')
+    parser.add_argument('--sndbuf', type=int, default=None, help='Socket send buffer size in bytes (protocol transport).')
+    parser.add_argument('--rcvbuf', type=int, default=None, help='Socket receive buffer size in bytes (protocol transport).')
+    parser.add_argument('-w', '--workers', choices=['inline', 'thread', 'process'], default='inline', help='Where hand evaluation runs, on the event loop or in a worker pool.')
+    parser.add_argument('--worker-count', type=int, default=None, help='Number of workers in the pool.')
+    parser.add_argument('--latency-budget', type=float, default=LATENCY_BUDGET, help='Seconds to wait on the worker pool before evaluating inline.')
+    parser.add_argument('-b', '--bots', action='store_true', required=False, help='Fill empty seats with bots, so a single player can start a game.')
+    parser.add_argument('--bot-budget', type=float, default=DECISION_BUDGET, help='Seconds of CPU each bot decision may use.')
+    parser.add_argument('--bot-workers', type=int, default=BOT_WORKERS, help='Worker processes shared by all bots.')
+    parser.add_argument('--admin-port', type=int, default=None, help='Port for the admin channel (see admin.py), off by default.')
+    parser.add_argument('--admin-host', default=ADMIN_HOST, help='Address the admin channel listens on, local only by default.')
+    parser.add_argument('--admin-token', default=None, help='Token admin connections must send first.')
+    parser.add_argument('--hand-log', default=None, help='Directory to record every finished hand to, for analytics.py queries.')
+    parser.add_argument('--hand-log-chunk', type=int, default=CHUNK_SIZE, help='Hands per hand log chunk file.')
+    parser.add_argument('--hand-log-interval', type=float, default=FLUSH_INTERVAL, help='Seconds between hand log writes when a chunk has not filled.')
+    parser.add_argument('--no-watchdog', dest='watchdog', action='store_false', help='Turn off the event loop lag watchdog.')
+    parser.add_argument('--lag-threshold', type=float, default=LAG_THRESHOLD, help='Event loop lag in seconds that is logged as a stall, with what was running.')
+    parser.add_argument('--checkpoint', default=None, help='Directory to checkpoint table state to. Tables found there on startup are restored.')
+    parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL, help='Seconds between checkpoints.')
+    parser.add_argument('--reconnect-timeout', type=float, default=RECONNECT_TIMEOUT, help='Seconds restored players have to reconnect before their seat is freed.')
+    args = parser.parse_args(argv)
+    if args.equity_table:
+        args.current_hand = True    # Equities are only sent along with the current hand
+    return args
+
+
+async def main(args=None):
+    if args is None:
+        args = parse_args()
+    admission = AdmissionControl(args.max_connections, args.max_per_ip, args.rate, args.burst, args.max_frame)
+    workers = WorkerPool(args.workers, args.worker_count, latency_budget=args.latency_budget)
+    seed = args.seed
+    if args.record and seed is None:
+        seed = random.randrange(2 ** 32)    # Replays need to know how the deck was shuffled
+    poker_server = TCPokerServer(seed=seed, admission=admission, workers=workers)
     poker_server.solver = args.solve
+    poker_server.show_current_hand = args.current_hand
+    if args.equity_table:
+        poker_server.equity_table = EquityTable(args.equity_table)
+    if args.bots:
+        poker_server.bots = BotPool(args.bot_workers, args.bot_budget, poker_server.equity_table)
+    if args.hand_log:
+        poker_server.hand_log = HandLog(args.hand_log, args.hand_log_chunk, args.hand_log_interval)
+    if args.record:
+        poker_server.recorder = SessionRecorder(args.record, seed, args.solve, args.current_hand, admission, args.equity_table, args.bots)
+
+    # Pick up where a previous server left off, then keep checkpointing so the next one can too
+    checkpointer = None
+    background = set()
+    if args.checkpoint:
+        for state in checkpoint.load(args.checkpoint):
+            if state["table_id"] == poker_server.table_id:
+                checkpoint.restore(poker_server, state)
+                logging.info(f"Restored table {poker_server.table_id} from {args.checkpoint}: {[p.name for p in poker_server.players]}")
+                print(f"Restored table {poker_server.table_id} from {args.checkpoint}, waiting for players to reconnect.")
+                background.add(asyncio.create_task(poker_server.drop_restored_seats(args.reconnect_timeout)))
+        checkpointer = Checkpointer(args.checkpoint, [poker_server], args.checkpoint_interval)
+        background.add(asyncio.create_task(checkpointer.run()))
+
+    # Finished hands and recorded frames are written from a thread, never from the table's own coroutines
+    if poker_server.hand_log:
+        background.add(asyncio.create_task(poker_server.hand_log.run()))
+    if poker_server.recorder:
+        background.add(asyncio.create_task(poker_server.recorder.run()))
+
+    # Watch for anything that holds up the event loop, and every player with it
+    watchdog = None
+    if args.watchdog:
+        watchdog = LoopWatchdog(threshold=args.lag_threshold)
+        background.add(asyncio.create_task(watchdog.run()))
+
+    # SIGTERM (as sent when deploying) shuts down cleanly, writing a last checkpoint
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:
+        pass    # No signal handlers on Windows event loops
     
-    # Start TCP server
-    server = await asyncio.start_server(poker_server.handle_client, '0.0.0.0', args.port)
+    # Start TCP server. Both transports give up on frames larger than max_frame instead of buffering them
+    if args.transport == 'protocol':
+        server = await start_frame_server(poker_server.handle_client, '0.0.0.0', args.port, args.max_frame, args.sndbuf, args.rcvbuf)
+    else:
+        server = await asyncio.start_server(poker_server.handle_client, '0.0.0.0', args.port, limit=args.max_frame)
     addr = ('0.0.0.0', args.port)
     logging.info(f"Server listening on {addr}")
     print(f"Server listening on {addr}")
+    admin_server = None
+    if args.admin_port is not None:
+        admin = AdminChannel([poker_server], admission, args.admin_token, watchdog)
+        admin_server = await start_admin_server(admin, args.admin_port, args.admin_host)
+        logging.info(f"Admin channel listening on {(args.admin_host, args.admin_port)}")
     
-    async with server:
-        await server.serve_forever()
+    try:
+        async with server:
+            await stop.wait()
+            logging.info("Server stopping.")
+    finally:
+        if admin_server:
+            admin_server.close()
+        if checkpointer:
+            checkpointer.write()
+        for task in background:
+            task.cancel()
+        if poker_server.hand_log:
+            poker_server.hand_log.close()
+        if poker_server.recorder:
+            poker_server.recorder.close()
+        workers.shutdown()
+        if poker_server.bots:
+            poker_server.bots.shutdown()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        # Configure logging
+        filename='server.log',
+        level=logging.INFO, 
+        format='%(asctime)s - %(levelname)s - %(message)s'
+        )
+    args = parse_args()
+    if args.uvloop:
+        use_uvloop()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args))
     except KeyboardInterrupt:
         print("Server terminated by user.")
         logging.info("Server terminated by user.")
\ No newline at end of file
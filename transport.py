@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import socket
+from collections import deque
+
+
+MAX_PENDING_FRAMES = 64     # Stop reading from a socket once this many decoded frames are waiting to be handled
+
+
+
+def use_uvloop():
+    ''' Switches asyncio to uvloop's event loop if it is installed. Must be called before asyncio.run() '''
+    try:
+        import uvloop
+    except ImportError:
+        logging.warning("uvloop is not installed, using the default asyncio event loop.")
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logging.info("Using the uvloop event loop.")
+    return True
+
+
+def tune_socket(sock, sndbuf=None, rcvbuf=None):
+    ''' Disables Nagle's algorithm and optionally resizes the kernel send/receive buffers '''
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)     # Messages are tiny, send them straight away
+    if sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+
+
+
+class FrameBuffer:
+    ''' Incrementally splits a byte stream into '\n' delimited frames '''
+    def __init__(self, max_frame):
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+        self.scanned = 0    # Bytes of self.buffer already known not to contain a '\n'
+        self.overflow = False   # Set once a frame larger than max_frame is seen, the rest of the stream is dropped
+
+    def feed(self, data):
+        ''' Adds data to the buffer and returns every frame it completed, each still ending in '\n' '''
+        if self.overflow:
+            return []
+        self.buffer += data
+        frames = []
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', max(start, self.scanned))
+            if end == -1 or end - start > self.max_frame:
+                break
+            frames.append(bytes(self.buffer[start:end + 1]))
+            start = end + 1
+        del self.buffer[:start]
+        self.scanned = len(self.buffer)
+        # Same rule as StreamReader's limit, the frame excluding its '\n' may not be larger than max_frame
+        if end != -1 or len(self.buffer) > self.max_frame:
+            self.overflow = True
+            self.buffer.clear()
+        return frames
+
+
+
+class FrameProtocol(asyncio.Protocol):
+    ''' Lightweight replacement for a StreamReader/StreamWriter pair. Implements the small part of both interfaces
+        that TCPokerServer and TCPokerClient use (readline, write, drain, close, wait_closed, get_extra_info),
+        so the same object is passed as both the reader and the writer '''
+    def __init__(self, client_connected_cb=None, max_frame=65536, sndbuf=None, rcvbuf=None):
+        self.client_connected_cb = client_connected_cb
+        self.frame_buffer = FrameBuffer(max_frame)
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        self.transport = None
+        self.frames = deque()
+        self.error = None
+        self.eof = False
+        self.read_paused = False
+        self.read_waiter = None
+        self.write_paused = False
+        self.drain_waiter = None
+        self.closed = None
+        self.task = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.closed = asyncio.get_running_loop().create_future()
+        tune_socket(transport.get_extra_info('socket'), self.sndbuf, self.rcvbuf)
+        if self.client_connected_cb:
+            self.task = asyncio.get_running_loop().create_task(self.client_connected_cb(self, self))
+
+    def data_received(self, data):
+        self.frames.extend(self.frame_buffer.feed(data))
+        if self.frame_buffer.overflow and not self.error:
+            self.error = ValueError("Frame exceeds the maximum frame size.")
+            self.transport.pause_reading()     # Nothing after an oversized frame can be trusted
+        if len(self.frames) >= MAX_PENDING_FRAMES and not self.read_paused:
+            self.read_paused = True
+            self.transport.pause_reading()
+        self.wake_reader()
+
+    def eof_received(self):
+        self.eof = True
+        self.wake_reader()
+
+    def connection_lost(self, exc):
+        self.eof = True
+        self.wake_reader()
+        self.wake_drain(exc)
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def pause_writing(self):
+        self.write_paused = True
+
+    def resume_writing(self):
+        self.write_paused = False
+        self.wake_drain()
+
+    def wake_reader(self):
+        if self.read_waiter and not self.read_waiter.done():
+            self.read_waiter.set_result(None)
+
+    def wake_drain(self, exc=None):
+        if self.drain_waiter and not self.drain_waiter.done():
+            if exc:
+                self.drain_waiter.set_exception(exc)
+            else:
+                self.drain_waiter.set_result(None)
+
+    async def readline(self):
+        ''' Returns the next complete frame, or b'' once the connection is closed '''
+        while not self.frames:
+            if self.error:
+                raise self.error
+            if self.eof:
+                return b''
+            self.read_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.read_waiter
+            finally:
+                self.read_waiter = None
+        frame = self.frames.popleft()
+        if self.read_paused and len(self.frames) < MAX_PENDING_FRAMES // 2:
+            self.read_paused = False
+            self.transport.resume_reading()
+        return frame
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        if self.transport.is_closing():
+            await asyncio.sleep(0)      # Matches StreamWriter, give connection_lost a chance to run
+        if self.write_paused:
+            self.drain_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.drain_waiter
+            finally:
+                self.drain_waiter = None
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+    def close(self):
+        self.transport.close()
+
+    async def wait_closed(self):
+        await self.closed
+
+
+
+async def start_frame_server(client_connected_cb, host, port, max_frame=65536, sndbuf=None, rcvbuf=None):
+    ''' asyncio.start_server() equivalent that serves connections with FrameProtocol '''
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(lambda: FrameProtocol(client_connected_cb, max_frame, sndbuf, rcvbuf), host, port)
+
+
+async def open_frame_connection(host, port, max_frame=65536, sndbuf=None, rcvbuf=None):
+    ''' asyncio.open_connection() equivalent, returns (reader, writer) which are the same FrameProtocol '''
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_connection(lambda: FrameProtocol(None, max_frame, sndbuf, rcvbuf), host, port)
+    return protocol, protocol
@@ -0,0 +1,106 @@
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+
+LAG_INTERVAL = 0.05     # Seconds between heartbeats on the event loop
+LAG_THRESHOLD = 0.1     # Lag (in seconds) that counts as a stall and is attributed
+STALL_HISTORY = 100     # Recent stalls kept for the admin channel
+STACK_DEPTH = 12        # Frames kept from each stack sample
+
+
+
+class LoopWatchdog:
+    ''' Measures event loop lag, and attributes stalls to whatever was running.
+        run() is a heartbeat task on the loop that measures how late each of its wake ups is. A separate thread watches
+        the heartbeat, and when the loop has been stuck past the threshold it samples the loop thread's stack, the running
+        task's coroutine and the table it belongs to. Once the loop gets going again the stall is logged with its full length '''
+    def __init__(self, interval=LAG_INTERVAL, threshold=LAG_THRESHOLD, history=STALL_HISTORY):
+        self.interval = interval
+        self.threshold = threshold
+        self.loop = None
+        self.thread_id = None
+        self.heartbeat = time.monotonic()
+        self.pending = None     # Sample taken by the watching thread during the current stall
+        self.stalls = deque(maxlen=history)
+        self.ticks = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.stall_count = 0
+        self.stopped = threading.Event()
+
+    async def run(self):
+        ''' Heartbeat task, runs until cancelled '''
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        threading.Thread(target=self.watch, name='loop-watchdog', daemon=True).start()
+        try:
+            while True:
+                self.heartbeat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                self.tick(max(0.0, time.monotonic() - self.heartbeat - self.interval))
+        finally:
+            self.stopped.set()
+
+    def tick(self, lag):
+        self.ticks += 1
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        sample, self.pending = self.pending, None
+        if lag < self.threshold:
+            return
+        # Stalls shorter than the watching thread's polling can end before it samples them, they are still counted
+        stall = dict(sample or {"task": None, "coroutine": None, "table_id": None, "stack": []}, lag=round(lag, 4), time=time.time())
+        self.stalls.append(stall)
+        self.stall_count += 1
+        logging.warning(f"Event loop stalled for {lag:.3f}s in {stall['coroutine'] or 'an unknown callback'}"
+                        f" (task {stall['task']}, table {stall['table_id']})" + "".join(f"\n    {line}" for line in stall["stack"]))
+
+    def watch(self):
+        ''' Watching thread. Samples the loop thread once per stall, while it is still stuck '''
+        sampled = None
+        while not self.stopped.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            if sampled != heartbeat and time.monotonic() - heartbeat - self.interval > self.threshold:
+                sampled = heartbeat
+                try:
+                    self.pending = self.sample()
+                except Exception as e:
+                    logging.error(f"Failed to sample the event loop: {e!r}")
+
+    def sample(self):
+        ''' What the loop thread is running right now: the current task's coroutine, the innermost coroutine running in it
+            (such as determine_winner inside start_game), the table id of the innermost method running on a table
+            (any frame whose self has a table_id), and the innermost frames of its stack '''
+        frame = sys._current_frames().get(self.thread_id)
+        task = asyncio.current_task(self.loop)
+        coroutine = table_id = None
+        current = frame
+        while current is not None and (coroutine is None or table_id is None):
+            if coroutine is None and current.f_code.co_flags & inspect.CO_COROUTINE:
+                coroutine = current.f_code.co_qualname
+            if table_id is None:
+                table_id = getattr(current.f_locals.get('self'), 'table_id', None)
+            current = current.f_back
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        return {
+            "task": task.get_coro().__qualname__ if task else None,
+            "coroutine": coroutine or (f"callback {stack[-1].name}" if stack else None),
+            "table_id": table_id,
+            "stack": [f"{entry.filename}:{entry.lineno} in {entry.name}" for entry in stack],
+        }
+
+    def stats(self):
+        ''' Lag metrics, as reported by the admin channel's 'lag' command '''
+        return {
+            "ticks": self.ticks,
+            "lag_mean": round(self.lag_total / self.ticks, 4) if self.ticks else 0.0,
+            "lag_max": round(self.lag_max, 4),
+            "stalls": self.stall_count,
+            "recent": list(self.stalls)[-5:],
+        }
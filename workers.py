@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import evaluator
+
+
+BATCH_WINDOW = 0.002    # Seconds to collect showdown requests from all tables before sending them to the pool together
+LATENCY_BUDGET = 0.25   # Seconds to wait on the pool before evaluating inline instead
+
+
+def process_pool(max_workers=None):
+    ''' A ProcessPoolExecutor for the server, with workers that load the evaluator and start up front.
+        Workers are spawned rather than forked: a forked worker inherits copies of the server's client sockets, and a
+        socket a worker still holds open never reaches EOF, so the server doesn't see that client close its connection '''
+    executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'), initializer=evaluator.warm_up)
+    for _ in range(max_workers or 1):
+        executor.submit(evaluator.warm_up)      # Start the workers now rather than on the first request
+    return executor
+
+
+
+class WorkerPool:
+    ''' Runs CPU-heavy work (hand evaluation, analytics, hand histories) off the event loop.
+        mode is 'inline' (no pool, evaluate on the loop), 'thread' or 'process' '''
+    def __init__(self, mode='inline', max_workers=None, batch_window=BATCH_WINDOW, latency_budget=LATENCY_BUDGET):
+        self.mode = mode
+        self.batch_window = batch_window
+        self.latency_budget = latency_budget
+        self.pending = []       # (card_sets, future) requests waiting for the next batch
+        self.flush_handle = None
+        if mode == 'process':
+            self.executor = process_pool(max_workers)
+        elif mode == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers)
+        elif mode == 'inline':
+            self.executor = None
+        else:
+            raise ValueError(f"Unknown worker pool mode: {mode}")
+
+    async def run(self, func, *args):
+        ''' Runs func(*args) in the pool. func must be picklable in process mode '''
+        if self.executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def solve(self, card_sets):
+        ''' Returns evaluator.solve() results, (best hand, score), for each set of cards.
+            Requests arriving within batch_window of each other are sent to the pool in a single call.
+            If the pool has not answered within latency_budget the cards are evaluated inline '''
+        if self.executor is None:
+            return evaluator.solve_batch(card_sets)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((card_sets, future))
+        if self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_window, self.flush)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.latency_budget)
+        except asyncio.TimeoutError:
+            logging.warning(f"Worker pool missed its {self.latency_budget}s latency budget, evaluating inline.")
+            future.cancel()     # Its pool result is dropped once it arrives
+        except Exception as e:
+            logging.error(f"Worker pool failed, evaluating inline: {e}")
+        return evaluator.solve_batch(card_sets)
+
+    def flush(self):
+        ''' Sends every pending request to the pool as one batch '''
+        self.flush_handle = None
+        batch, self.pending = self.pending, []
+        card_sets = [cards for request, _ in batch for cards in request]
+        try:
+            pool_future = asyncio.wrap_future(self.executor.submit(evaluator.solve_batch, card_sets))
+        except Exception as e:
+            self.distribute(batch, None, e)
+            return
+        pool_future.add_done_callback(lambda f: self.distribute(batch, *self.outcome(f)))
+
+    @staticmethod
+    def outcome(future):
+        if future.cancelled():
+            return None, RuntimeError("Worker pool cancelled the request.")
+        if future.exception():
+            return None, future.exception()
+        return future.result(), None
+
+    @staticmethod
+    def distribute(batch, results, error):
+        ''' Hands each request its slice of the batch results '''
+        position = 0
+        for card_sets, future in batch:
+            if not future.done():
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(results[position:position + len(card_sets)])
+            position += len(card_sets)
+
+    def shutdown(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)